@@ -0,0 +1,182 @@
+"""Logging setup for ToneReader.
+
+All diagnostics go through the standard `logging` module under the
+"tonereader" logger. Records are handed to a QueueHandler, so the
+watcher and TTS threads never block on I/O or on the GUI; a single
+QueueListener thread fans them out to the console, an optional
+size-rotated log file and any extra sinks (the GUI log pane).
+
+Use lazy %-style arguments (`log.debug("Read %d bytes", n)`) so disabled
+levels cost only a level check on the hot path.
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = 'tonereader'
+
+# Extra levels used by the log pane filters. Both sit just above INFO so
+# they're shown by default.
+READ = logging.INFO + 1
+SPOKEN = logging.INFO + 2
+logging.addLevelName(READ, 'READ')
+logging.addLevelName(SPOKEN, 'SPOKEN')
+
+# Level -> tag shown in front of the message ("[DEBUG] ...").
+_TAGS = {
+    logging.DEBUG: 'DEBUG',
+    logging.INFO: 'INFO',
+    READ: 'READ',
+    SPOKEN: None,
+    logging.WARNING: 'WARN',
+    logging.ERROR: 'ERROR',
+    logging.CRITICAL: 'ERROR',
+}
+
+# Tag -> level, for entries that arrive already tagged via add_log_entry().
+_TAG_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'READ': READ,
+    'WARN': logging.WARNING,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+_listener = None
+
+
+def get_logger(name=None):
+    """Return the app logger or a child of it ("tonereader.<name>")."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def level_for_entry(entry):
+    """Return the logging level for a pre-tagged entry like "[READ] ...".
+
+    Untagged entries are spoken text (SPOKEN); unknown tags are INFO.
+    """
+    if entry.startswith('['):
+        end = entry.find(']', 1, 12)
+        if end > 0:
+            tag = entry[1:end].upper()
+            if tag.isalpha():
+                return _TAG_LEVELS.get(tag, logging.INFO)
+    return SPOKEN
+
+
+class TagFormatter(logging.Formatter):
+    """Formats records as "[TAG] message", matching the log pane style.
+
+    Records logged with extra={'tagged': True} already carry their tag in
+    the message and are left as they are.
+    """
+
+    def format(self, record):
+        msg = record.getMessage()
+        if not getattr(record, 'tagged', False):
+            tag = _TAGS.get(record.levelno, record.levelname)
+            if tag:
+                msg = f"[{tag}] {msg}"
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            msg = f"{msg}\n{record.exc_text}"
+        return msg
+
+
+class TimestampFormatter(TagFormatter):
+    """TagFormatter with a leading timestamp, for the console and log file."""
+
+    def format(self, record):
+        return f"{self.formatTime(record, self.datefmt)} {super().format(record)}"
+
+
+class SinkHandler(logging.Handler):
+    """Calls `sink(entry, created)` with the formatted entry for each record.
+
+    The sink runs on the listener thread, so it must be thread-safe and
+    should not block (the GUI sink just queues entries for Tk).
+    """
+
+    def __init__(self, sink, level=logging.NOTSET):
+        super().__init__(level)
+        self.sink = sink
+        self.setFormatter(TagFormatter())
+
+    def emit(self, record):
+        try:
+            self.sink(self.format(record), record.created)
+        except Exception:
+            self.handleError(record)
+
+
+def setup(level=logging.INFO, log_file=None, max_bytes=1024 * 1024, backup_count=3, console=True):
+    """Configure the "tonereader" logger. Safe to call more than once.
+
+    level: minimum level passed on to any sink.
+    log_file: optional path of a size-rotated log file.
+    console: also write to stderr.
+    """
+    global _listener
+    shutdown()
+
+    handlers = []
+    if console:
+        h = logging.StreamHandler(sys.stderr)
+        h.setFormatter(TimestampFormatter(datefmt='%H:%M:%S'))
+        handlers.append(h)
+    if log_file:
+        try:
+            h = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                     backupCount=backup_count, encoding='utf-8')
+            h.setFormatter(TimestampFormatter())
+            handlers.append(h)
+        except Exception as e:
+            print(f"[WARN] Could not open log file {log_file}: {e}", file=sys.stderr)
+
+    logger = get_logger()
+    logger.setLevel(level)
+    logger.propagate = False
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+    q = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(q))
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    return logger
+
+
+def add_sink(sink, level=logging.NOTSET):
+    """Send every record to `sink(entry, created)` from now on."""
+    if _listener is None:
+        setup()
+    handler = SinkHandler(sink, level)
+    _listener.handlers = tuple(_listener.handlers) + (handler,)
+    return handler
+
+
+def remove_sink(handler):
+    if _listener is not None:
+        _listener.handlers = tuple(h for h in _listener.handlers if h is not handler)
+
+
+def set_level(level):
+    get_logger().setLevel(level)
+
+
+def shutdown():
+    """Stop the listener thread after flushing queued records."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        for h in _listener.handlers:
+            try:
+                h.close()
+            except Exception:
+                pass
+        _listener = None
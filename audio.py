@@ -0,0 +1,451 @@
+"""PCM playback through one persistent output stream.
+
+Instead of letting each pyttsx3 engine play its own audio (and paying
+for engine start-up and driver teardown between messages), TTSWorker can
+render each segment to a WAV file with `engine.save_to_file()`, load it
+as 16-bit mono PCM (`render()`), and submit it to a PCMStream. The
+stream's writer thread feeds a single sink for the whole session:
+
+  - DeviceSink: a sounddevice output stream (optional dependency).
+  - WavSink: a WAV file, for headless testing and recordings.
+
+Consecutive utterances are concatenated without a gap; with crossfade_ms
+set, the end of one is faded into the start of the next. Leading and
+trailing silence that engines pad every utterance with is trimmed. Gaps
+between back-to-back utterances are measured on the output timeline and
+published as `tonereader_audio_gap_seconds`.
+"""
+import math
+import os
+import sys
+import threading
+import wave
+from array import array
+from collections import deque
+
+import applog
+import clock as clock_mod
+import metrics
+import utils
+
+try:
+    import sounddevice
+    _HAS_SOUNDDEVICE = True
+except Exception:
+    sounddevice = None
+    _HAS_SOUNDDEVICE = False
+
+log = applog.get_logger('audio')
+
+_GAPS = metrics.REGISTRY.summary(
+    'tonereader_audio_gap_seconds', 'Silence between back-to-back utterances on the output stream')
+_UNDERRUNS = metrics.REGISTRY.counter(
+    'tonereader_audio_underruns_total', 'Times the output stream writer fell behind real time')
+
+DEFAULT_RATE = 22050
+
+_GAP_HISTORY = 200
+
+
+# --- PCM helpers ------------------------------------------------------------
+
+def load_wav(path):
+    """Read a WAV file as (array('h') of mono samples, sample rate).
+
+    8- and 16-bit PCM are supported; multi-channel audio is averaged
+    down to mono.
+    """
+    with wave.open(path, 'rb') as w:
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        rate = w.getframerate()
+        data = w.readframes(w.getnframes())
+    if width == 2:
+        samples = array('h')
+        samples.frombytes(data[:len(data) - len(data) % 2])
+        if sys.byteorder == 'big':
+            samples.byteswap()
+    elif width == 1:
+        samples = array('h', ((b - 128) << 8 for b in data))
+    else:
+        raise ValueError(f"unsupported sample width: {width * 8} bits")
+    if channels > 1:
+        samples = array('h', (sum(samples[i:i + channels]) // channels
+                              for i in range(0, len(samples) - channels + 1, channels)))
+    return samples, rate
+
+
+def resample(samples, src_rate, dst_rate):
+    """Linear-interpolation resample (adequate for speech)."""
+    if src_rate == dst_rate or not samples:
+        return samples
+    n = max(1, int(len(samples) * dst_rate / src_rate))
+    step = src_rate / dst_rate
+    last = len(samples) - 1
+    out = array('h', bytes(2 * n))
+    for i in range(n):
+        x = i * step
+        j = int(x)
+        if j >= last:
+            out[i] = samples[last]
+        else:
+            f = x - j
+            out[i] = int(samples[j] + (samples[j + 1] - samples[j]) * f)
+    return out
+
+
+def trim_silence(samples, rate, threshold=200, keep_ms=15):
+    """Strip leading/trailing samples quieter than `threshold`, keeping
+    `keep_ms` of lead-in/out so word onsets aren't clipped."""
+    n = len(samples)
+    start = 0
+    while start < n and abs(samples[start]) < threshold:
+        start += 1
+    if start == n:
+        return array('h')
+    end = n
+    while end > start and abs(samples[end - 1]) < threshold:
+        end -= 1
+    keep = int(rate * keep_ms / 1000.0)
+    return samples[max(0, start - keep):min(n, end + keep)]
+
+
+def crossfade(tail, head):
+    """Mix `tail` (fading out) over the start of `head` (fading in).
+
+    Returns the overlapped region followed by the rest of `head`.
+    """
+    n = min(len(tail), len(head))
+    if n == 0:
+        return tail + head
+    out = array('h', bytes(2 * n))
+    for i in range(n):
+        w = (i + 1) / (n + 1)
+        v = int(tail[i] * (1.0 - w) + head[i] * w)
+        out[i] = -32768 if v < -32768 else 32767 if v > 32767 else v
+    out.extend(tail[n:])
+    out.extend(head[n:])
+    return out
+
+
+def render(engine, text, path, rate=DEFAULT_RATE):
+    """Render `text` with a pyttsx3-style engine to PCM at `rate`.
+
+    Uses engine.save_to_file() + runAndWait() and loads the result;
+    `path` is a scratch WAV path that is removed afterwards.
+    """
+    engine.save_to_file(text, path)
+    engine.runAndWait()
+    try:
+        samples, src_rate = load_wav(path)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return trim_silence(resample(samples, src_rate, rate), rate)
+
+
+# --- Sinks ------------------------------------------------------------------
+
+class WavSink:
+    """Writes the stream to a 16-bit mono WAV file."""
+    # Writes return immediately; PCMStream paces them when realtime.
+    paced = False
+
+    def __init__(self, path):
+        self.path = path
+        self._w = None
+
+    def open(self, rate):
+        self._w = wave.open(self.path, 'wb')
+        self._w.setnchannels(1)
+        self._w.setsampwidth(2)
+        self._w.setframerate(rate)
+
+    def write(self, samples):
+        if sys.byteorder == 'big':
+            samples = array('h', samples)
+            samples.byteswap()
+        self._w.writeframes(samples.tobytes())
+
+    def close(self):
+        if self._w is not None:
+            try:
+                self._w.close()
+            except Exception:
+                pass
+            self._w = None
+
+
+class DeviceSink:
+    """Plays the stream on an audio device via sounddevice.
+
+    latency: device buffer in seconds (the output-side jitter buffer).
+    """
+    # write() blocks until the device has room, which paces the stream.
+    paced = True
+
+    def __init__(self, latency=0.06, device=None):
+        if not _HAS_SOUNDDEVICE:
+            raise RuntimeError("sounddevice is not installed (pip install sounddevice)")
+        self.latency = latency
+        self.device = device
+        self._stream = None
+
+    def open(self, rate):
+        self._stream = sounddevice.RawOutputStream(samplerate=rate, channels=1, dtype='int16',
+                                                   latency=self.latency, device=self.device)
+        self._stream.start()
+
+    def write(self, samples):
+        self._stream.write(samples.tobytes())
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+
+
+# --- Stream -----------------------------------------------------------------
+
+class Utterance:
+    """A submitted PCM buffer; `started` is set when it reaches the sink
+    and `done` once all of it has been written (or it was dropped)."""
+    __slots__ = ('samples', 'pos', 'submitted_at', 'started', 'started_at', 'done')
+
+    def __init__(self, samples, submitted_at):
+        self.samples = samples
+        self.pos = 0
+        self.submitted_at = submitted_at
+        self.started = threading.Event()
+        self.started_at = None
+        self.done = threading.Event()
+
+
+class PCMStream:
+    """A single output stream fed with rendered utterances.
+
+    sink: WavSink, DeviceSink or anything with open(rate)/write(array)/close().
+    rate: stream sample rate; submitted audio is resampled to it.
+    block_ms: size of each write to the sink.
+    jitter_ms: how far ahead of real time the writer may run (for sinks
+        that don't pace themselves), absorbing scheduling jitter.
+    crossfade_ms: overlap between back-to-back utterances (0 = plain
+        gapless concatenation).
+    realtime: write silence while idle and keep the output timeline in
+        step with the clock. With False, audio is written as fast as it
+        arrives and nothing is written while idle (a WAV of just the
+        speech; use this for file sinks, which would otherwise grow by
+        ~44 KB/s for as long as the app runs).
+    max_gap: an utterance submitted more than this many seconds after the
+        previous one finished is a new burst of traffic, not a gap.
+    """
+
+    def __init__(self, sink, rate=DEFAULT_RATE, block_ms=20, jitter_ms=60, crossfade_ms=10,
+                 realtime=True, max_gap=1.0, clock=None):
+        self.sink = sink
+        self.rate = rate
+        self.block = max(1, int(rate * block_ms / 1000.0))
+        self.jitter = jitter_ms / 1000.0
+        self.crossfade = int(rate * crossfade_ms / 1000.0)
+        self.realtime = realtime
+        self.max_gap = max_gap
+        self.clock = clock or clock_mod.SYSTEM
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._current = None
+        self._stop = False
+        self._thread = None
+        # Samples written so far and the clock time of sample 0.
+        self._pos = 0
+        self._t0 = None
+        # Stream position / time where the last utterance ended.
+        self._last_end_pos = None
+        self._last_end_time = None
+        self.gaps = deque(maxlen=_GAP_HISTORY)
+        self.underruns = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.sink.open(self.rate)
+        self._stop = False
+        self._t0 = self.clock.time()
+        self._thread = threading.Thread(target=self._loop, name='audio', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Finish playing what's queued (up to `timeout`) and close the sink."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def submit(self, samples, rate=None):
+        """Queue PCM samples for playback; returns an Utterance."""
+        if rate is not None and rate != self.rate:
+            samples = resample(samples, rate, self.rate)
+        utt = Utterance(samples, self.clock.time())
+        with self._cond:
+            self._queue.append(utt)
+            self._cond.notify_all()
+        return utt
+
+    def interrupt(self, fade_ms=5):
+        """Drop queued audio and cut the current utterance with a short fade."""
+        with self._cond:
+            for utt in self._queue:
+                utt.started.set()
+                utt.done.set()
+            self._queue.clear()
+            cur = self._current
+            if cur is not None:
+                n = min(len(cur.samples) - cur.pos, int(self.rate * fade_ms / 1000.0))
+                tail = cur.samples[cur.pos:cur.pos + n]
+                for i in range(n):
+                    tail[i] = int(tail[i] * (1.0 - (i + 1) / (n + 1)))
+                cur.samples = tail
+                cur.pos = 0
+            self._cond.notify_all()
+
+    def buffered(self):
+        """Seconds of audio queued or still playing from the current utterance."""
+        with self._cond:
+            n = sum(len(u.samples) for u in self._queue)
+            if self._current is not None:
+                n += len(self._current.samples) - self._current.pos
+        return n / float(self.rate)
+
+    def wait_started(self, utt, event=None, timeout=None):
+        """Wait until `utt` reaches the sink (or `event` is set); return started."""
+        deadline = None if timeout is None else self.clock.time() + timeout
+        while not utt.started.is_set():
+            if event is not None and event.is_set():
+                break
+            if self._stop or (deadline is not None and self.clock.time() >= deadline):
+                break
+            utt.started.wait(0.02)
+        return utt.started.is_set()
+
+    def gap_stats(self):
+        return utils.percentiles([g * 1000.0 for g in self.gaps])
+
+    # --- writer thread ---------------------------------------------------
+    def _now(self, pos):
+        """Output-timeline time of stream position `pos`."""
+        if self.realtime:
+            return self._t0 + pos / float(self.rate)
+        return self.clock.time()
+
+    def _begin(self, utt, at_pos):
+        """Make `utt` current, recording the gap since the previous one."""
+        self._current = utt
+        if self._last_end_pos is not None and utt.submitted_at <= self._last_end_time + self.max_gap:
+            if self.realtime:
+                # Silence written since the previous end; crossfaded
+                # starts overlap it: no gap.
+                gap = max(0.0, (at_pos - self._last_end_pos) / float(self.rate))
+            else:
+                # No silence is written, so measure the wait in time.
+                gap = max(0.0, self.clock.time() - self._last_end_time)
+            self.gaps.append(gap)
+            _GAPS.observe(gap)
+
+    def _take(self, n):
+        """Pull up to n samples of queued audio; returns (block, started)."""
+        out = array('h')
+        started = []
+        while len(out) < n:
+            cur = self._current
+            if cur is None:
+                if not self._queue:
+                    break
+                utt = self._queue.popleft()
+                self._begin(utt, self._pos + len(out))
+                started.append(utt)
+                continue
+            remaining = len(cur.samples) - cur.pos
+            xf = self.crossfade
+            if xf and self._queue and remaining <= xf:
+                # Overlap what's left of this one with the start of the next.
+                nxt = self._queue.popleft()
+                nxt.samples = crossfade(cur.samples[cur.pos:], nxt.samples)
+                self._end(self._pos + len(out) + remaining)
+                self._begin(nxt, self._pos + len(out))
+                started.append(nxt)
+                continue
+            # Hold back the last `xf` samples in case a next utterance
+            # arrives to crossfade into.
+            avail = remaining - xf if xf and remaining > xf else remaining
+            take = min(n - len(out), avail)
+            out.extend(cur.samples[cur.pos:cur.pos + take])
+            cur.pos += take
+            if cur.pos >= len(cur.samples):
+                self._end(self._pos + len(out))
+        return out, started
+
+    def _end(self, at_pos):
+        if self._current is not None:
+            self._current.done.set()
+        self._current = None
+        self._last_end_pos = at_pos
+        self._last_end_time = self._now(at_pos)
+
+    def _pace(self):
+        due = self._t0 + self._pos / float(self.rate)
+        now = self.clock.time()
+        if now < due - self.jitter:
+            self.clock.sleep(due - self.jitter - now)
+        elif now > due + self.jitter + self.block / float(self.rate):
+            # Fell behind (e.g. the process was suspended); re-anchor the
+            # timeline rather than writing a burst of catch-up audio.
+            self.underruns += 1
+            _UNDERRUNS.inc()
+            self._t0 = now - self._pos / float(self.rate)
+
+    def _loop(self):
+        silence = array('h', bytes(2 * self.block))
+        try:
+            while True:
+                with self._cond:
+                    if not self.realtime:
+                        while not self._queue and self._current is None and not self._stop:
+                            self._cond.wait()
+                    if self._stop and not self._queue and self._current is None:
+                        break
+                    block, started = self._take(self.block)
+                    self._cond.notify_all()
+                if self.realtime and len(block) < self.block:
+                    block.extend(silence[:self.block - len(block)])
+                if self.realtime and not self.sink.paced:
+                    self._pace()
+                self.sink.write(block)
+                self._pos += len(block)
+                now = self.clock.time()
+                for utt in started:
+                    utt.started_at = now
+                    utt.started.set()
+        except Exception:
+            log.exception("Audio output stream failed")
+        finally:
+            with self._cond:
+                for utt in self._queue:
+                    utt.started.set()
+                    utt.done.set()
+                self._queue.clear()
+                if self._current is not None:
+                    self._current.done.set()
+            self.sink.close()
+
+
+def tone(duration, rate=DEFAULT_RATE, freq=440.0, amplitude=3000):
+    """A sine tone as PCM samples (used by NullEngine.save_to_file)."""
+    n = int(duration * rate)
+    k = 2.0 * math.pi * freq / rate
+    return array('h', (int(amplitude * math.sin(k * i)) for i in range(n)))
@@ -0,0 +1,301 @@
+"""Microbenchmarks for the per-line / per-change hot paths.
+
+Each benchmark runs one function in isolation over a fixed, seeded input
+corpus and reports the best time per operation over several repeats.
+
+    python bench.py run [NAME ...]            print results
+    python bench.py baseline                  write benchmarks/baseline.json
+    python bench.py compare [--threshold 0.15] [--baseline PATH]
+                                              run and compare; exit 1 on regression
+
+Baselines are only comparable on the machine (and Python) that wrote
+them; re-run `baseline` after changing either. The plain-text report of
+the last run is written to bench_output.txt (ignored by git).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import utils
+from watcher import ChatLogTracker, split_buffer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, 'benchmarks', 'baseline.json')
+OUTPUT_PATH = os.path.join(HERE, 'bench_output.txt')
+
+DEFAULT_THRESHOLD = 0.15
+# Each repeat runs for at least this long; the best repeat is reported.
+MIN_TIME = 0.2
+REPEATS = 5
+
+
+# --- corpora ------------------------------------------------------------------
+
+_WORDS = ("engine truck medic battalion respond to a structure fire at the docks "
+          "vehicle accident on the freeway with entrapment code 3 units en route "
+          "staging at grove street smoke showing from the second floor all clear").split()
+
+
+def _stamp(rng):
+    return f"[{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}]"
+
+
+def corpus(n=2000, tone_ratio=0.2, seed=1234):
+    """Chat lines like the game writes them; about `tone_ratio` are tones."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(n):
+        text = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(4, 24)))
+        if rng.random() < tone_ratio:
+            marker = rng.choice(("** STATION TONE", "** [STATION TONE]", "**STATION  TONE"))
+            lines.append(f"{_stamp(rng)} {marker} {text}")
+        else:
+            lines.append(f"{_stamp(rng)} {rng.choice(_WORDS).title()} says: {text}")
+    return lines
+
+
+# --- benchmarks -----------------------------------------------------------------
+# Each factory builds its inputs once and returns (run, ops): run() does
+# `ops` operations.
+
+def bench_clean_text():
+    lines = [line for line in corpus() if utils.MARKER_RE.search(line)]
+
+    def run():
+        for line in lines:
+            utils.clean_text(line)
+    return run, len(lines)
+
+
+def bench_marker_search():
+    lines = corpus()
+    search = utils.MARKER_RE.search
+
+    def run():
+        for line in lines:
+            search(line)
+    return run, len(lines)
+
+
+def bench_chatlog_append():
+    """ChatLogTracker.update when the game appended a few lines (fast path)."""
+    lines = corpus(4000)
+    history = 1000
+    snapshots = ['\n'.join(lines[:history + i]) + '\n' for i in range(0, 200, 5)]
+
+    def run():
+        tracker = ChatLogTracker()
+        for chat in snapshots:
+            tracker.update(chat)
+    return run, len(snapshots)
+
+
+def bench_chatlog_align():
+    """ChatLogTracker.update when old lines were trimmed from the front."""
+    lines = corpus(4000)
+    history = 1000
+    snapshots = ['\n'.join(lines[i:history + i]) + '\n' for i in range(0, 200, 5)]
+
+    def run():
+        tracker = ChatLogTracker()
+        for chat in snapshots:
+            tracker.update(chat)
+    return run, len(snapshots)
+
+
+def bench_split_buffer():
+    """Watcher read path: split 4 KB reads into lines, carrying partials."""
+    data = ('\n'.join(corpus()) + '\n').encode('utf-8')
+    chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+
+    def run():
+        buffer = b''
+        for chunk in chunks:
+            lines, buffer = split_buffer(buffer + chunk)
+    return run, len(chunks)
+
+
+def bench_tts_utterance():
+    """TTSWorker per-utterance work with a NullEngine: engine setup,
+    configuration and segmenting/saying one message."""
+    from ttswrapper import NullEngine, TTSWorker
+    worker = TTSWorker(engine_factory=lambda: NullEngine(words_per_minute=0))
+    texts = [utils.clean_text(line) for line in corpus(400) if utils.MARKER_RE.search(line)]
+
+    def run():
+        for text in texts:
+            eng = worker.engine_factory()
+            worker._configure(eng)
+            worker._speak_segments(eng, text, 0.0)
+            eng.stop()
+    return run, len(texts)
+
+
+BENCHMARKS = {
+    'clean_text': bench_clean_text,
+    'marker_search': bench_marker_search,
+    'chatlog_append': bench_chatlog_append,
+    'chatlog_align': bench_chatlog_align,
+    'split_buffer': bench_split_buffer,
+    'tts_utterance': bench_tts_utterance,
+}
+
+
+# --- runner -------------------------------------------------------------------
+
+def measure(factory, min_time=MIN_TIME, repeats=REPEATS):
+    """Return the best microseconds per operation for a benchmark factory."""
+    run, ops = factory()
+    run()  # warm-up
+    # Calibrate the number of calls per repeat to take at least min_time.
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeats - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, time.perf_counter() - t0)
+    return best / (loops * ops) * 1e6
+
+
+def run_all(names=None, min_time=MIN_TIME, repeats=REPEATS):
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        try:
+            results[name] = {'us_per_op': round(measure(factory, min_time, repeats), 4)}
+        except ImportError as e:
+            results[name] = {'skipped': str(e)}
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+
+def format_results(report, baseline=None, threshold=DEFAULT_THRESHOLD):
+    """Return (text, regressions) for a report, compared to `baseline` if given."""
+    out = [f"Python {report['python']} on {report['platform']}", '']
+    header = f"{'benchmark':<16} {'us/op':>12}"
+    if baseline is not None:
+        header += f" {'baseline':>12} {'change':>8}"
+    out.append(header)
+    regressions = []
+    base_results = (baseline or {}).get('results', {})
+    for name, r in report['results'].items():
+        if 'skipped' in r:
+            out.append(f"{name:<16} {'skipped':>12}  ({r['skipped']})")
+            continue
+        line = f"{name:<16} {r['us_per_op']:>12.3f}"
+        b = base_results.get(name, {}).get('us_per_op')
+        if baseline is not None:
+            if b:
+                change = r['us_per_op'] / b - 1.0
+                flag = ''
+                if change > threshold:
+                    flag = '  REGRESSION'
+                    regressions.append(name)
+                line += f" {b:>12.3f} {change:>+7.1%}{flag}"
+            else:
+                line += f" {'-':>12} {'new':>8}"
+        out.append(line)
+    if baseline is not None:
+        out.append('')
+        out.append(f"{len(regressions)} regression(s) over {threshold:.0%}" if regressions
+                   else f"No regressions over {threshold:.0%}")
+    return '\n'.join(out) + '\n', regressions
+
+
+def _write_output(text):
+    try:
+        with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
+            f.write(text)
+    except OSError:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ToneReader microbenchmarks")
+    sub = parser.add_subparsers(dest='command')
+    p_run = sub.add_parser('run', help="run benchmarks and print results")
+    p_base = sub.add_parser('baseline', help="run benchmarks and save them as the baseline")
+    p_cmp = sub.add_parser('compare', help="run benchmarks and compare with the baseline")
+    p_cmp.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help="fractional slowdown counted as a regression (default: %(default)s)")
+    for p in (p_run, p_base, p_cmp):
+        p.add_argument('names', nargs='*', metavar='NAME', help=f"benchmarks to run ({', '.join(BENCHMARKS)})")
+        p.add_argument('--baseline', default=BASELINE_PATH, help="baseline file (default: benchmarks/baseline.json)")
+        p.add_argument('--min-time', type=float, default=MIN_TIME, help="seconds per repeat")
+        p.add_argument('--repeats', type=int, default=REPEATS)
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in sub.choices and not argv[0].startswith('-h'):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+    command = args.command
+
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    report = run_all(args.names, args.min_time, args.repeats)
+
+    if command == 'baseline':
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        if args.names and os.path.exists(args.baseline):
+            # Update just the named benchmarks in an existing baseline.
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            existing['results'].update(report['results'])
+            report = {**report, 'results': existing['results']}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        text, _ = format_results(report)
+        text += f"\nBaseline written to {args.baseline}\n"
+        print(text, end='')
+        _write_output(text)
+        return 0
+
+    if command == 'compare':
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read baseline {args.baseline}: {e}", file=sys.stderr)
+            return 2
+        text, regressions = format_results(report, baseline, args.threshold)
+        if regressions:
+            # Re-measure before reporting: a single noisy repeat set on a
+            # busy machine shouldn't fail the comparison.
+            retry = run_all(regressions, args.min_time, args.repeats)['results']
+            for name, r in retry.items():
+                if 'us_per_op' in r:
+                    report['results'][name]['us_per_op'] = min(
+                        r['us_per_op'], report['results'][name]['us_per_op'])
+            text, regressions = format_results(report, baseline, args.threshold)
+        print(text, end='')
+        _write_output(text)
+        return 1 if regressions else 0
+
+    text, _ = format_results(report)
+    print(text, end='')
+    _write_output(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Clock abstraction for the watcher and TTS threads.
+
+Watcher and TTSWorker take a `clock` argument and use it for every
+timestamp, sleep, timed event wait and timed queue get. SYSTEM is the
+real clock. VirtualClock lets a test harness (see harness.py) advance
+time explicitly, so hours of simulated traffic run in seconds and timing
+results are reproducible.
+"""
+import queue
+import threading
+import time
+
+
+class SystemClock:
+    """Wall-clock time; thin wrappers over time/threading/queue."""
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """Wait for `event` for up to `timeout` seconds; return event.is_set()."""
+        return event.wait(timeout)
+
+    def get(self, q, timeout):
+        """q.get() with a timeout; raises queue.Empty like Queue.get."""
+        return q.get(timeout=timeout)
+
+
+SYSTEM = SystemClock()
+
+
+class VirtualClock:
+    """Deterministic clock driven by advance().
+
+    Threads that sleep/wait/get on this clock block until the harness moves
+    virtual time past their wake-up time (or, for wait/get, until the event
+    is set or the queue has an item). advance() steps from one wake-up to
+    the next and, after each step, waits until every attached thread is
+    blocked on the clock again, so the interleaving doesn't depend on how
+    fast the machine is.
+
+    Threads are attached automatically the first time they block on the
+    clock; call attach() right after starting a thread so advance() can't
+    run before it gets there.
+    """
+
+    # Real seconds between re-checks of wait()/get() conditions that are
+    # changed by other threads without going through the clock.
+    _POLL = 0.002
+
+    def __init__(self, start=0.0, settle_timeout=10.0):
+        self._now = float(start)
+        self._cond = threading.Condition()
+        # thread -> (wake_time, ready_predicate or None)
+        self._sleepers = {}
+        self._threads = set()
+        self._closed = False
+        self.settle_timeout = settle_timeout
+
+    # --- clock API used by the threads -----------------------------------
+    def time(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self._block(seconds, None)
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        self._block(timeout, event.is_set)
+        return event.is_set()
+
+    def get(self, q, timeout):
+        try:
+            return q.get_nowait()
+        except queue.Empty:
+            pass
+        self._block(timeout, lambda: not q.empty())
+        return q.get_nowait()
+
+    def _block(self, seconds, ready):
+        me = threading.current_thread()
+        with self._cond:
+            self._threads.add(me)
+            wake = self._now + max(0.0, seconds or 0.0)
+            self._sleepers[me] = (wake, ready)
+            self._cond.notify_all()
+            try:
+                while not self._closed and self._now < wake and not (ready and ready()):
+                    self._cond.wait(self._POLL if ready else None)
+            finally:
+                del self._sleepers[me]
+                self._cond.notify_all()
+
+    # --- harness API -----------------------------------------------------
+    def attach(self, thread):
+        """Tell the clock about a thread that will block on it."""
+        with self._cond:
+            self._threads.add(thread)
+
+    def _idle(self):
+        for t in list(self._threads):
+            if not t.is_alive():
+                if t.ident is not None:
+                    self._threads.discard(t)
+                continue
+            entry = self._sleepers.get(t)
+            if entry is None:
+                return False
+            wake, ready = entry
+            if wake <= self._now or (ready and ready()):
+                return False
+        return True
+
+    def settle(self):
+        """Block until every attached thread is waiting on the clock."""
+        deadline = time.monotonic() + self.settle_timeout
+        with self._cond:
+            while not self._idle():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError("VirtualClock: threads did not settle (blocked outside the clock?)")
+                self._cond.wait(min(self._POLL, remaining))
+
+    def advance(self, seconds):
+        """Move virtual time forward by `seconds`, running due wake-ups in order."""
+        target = self._now + seconds
+        while True:
+            self.settle()
+            with self._cond:
+                due = [w for w, _ in self._sleepers.values() if w <= target]
+                if not due:
+                    self._now = target
+                    self._cond.notify_all()
+                    break
+                self._now = max(self._now, min(due))
+                self._cond.notify_all()
+        self.settle()
+
+    def close(self):
+        """Release all blocked threads (e.g. on harness shutdown)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,79 @@
+"""Duplicate suppression for spoken messages.
+
+Game clients resend lines, `.storage` rewrites can shift content past the
+overlap alignment, and Feed Line can repeat earlier traffic. DedupeWindow
+remembers a fingerprint of each message for a limited time so a repeat
+within the window is dropped instead of being spoken again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+_SUPPRESSED = metrics.REGISTRY.counter(
+    'tonereader_duplicates_suppressed_total', 'Messages dropped as repeats within the dedupe window')
+
+
+def fingerprint(text, timestamp=None):
+    """Return a compact fingerprint for a message.
+
+    The text is lowercased and whitespace-collapsed so trivial differences
+    don't defeat the check. If the in-game timestamp is known it is part
+    of the key, so the same text toned out again later isn't suppressed.
+    """
+    norm = ' '.join((text or '').lower().split())
+    if timestamp is not None:
+        norm = f"{timestamp}|{norm}"
+    return hashlib.blake2b(norm.encode('utf-8', errors='surrogatepass'), digest_size=8).digest()
+
+
+class DedupeWindow:
+    """Time-bounded, fixed-size set of recently seen message fingerprints.
+
+    window_seconds: how long a message suppresses repeats of itself.
+    max_entries: hard cap on remembered fingerprints; the oldest are
+        forgotten first once it's reached.
+    """
+
+    def __init__(self, window_seconds=30.0, max_entries=1024):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        # fingerprint -> time first seen. Insertion order is time order, so
+        # expired entries are always at the front.
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def check(self, text, timestamp=None, now=None):
+        """Record a message; return True if it should be spoken.
+
+        Returns False (and counts it in `suppressed`) if the same message
+        was seen within the window.
+        """
+        if now is None:
+            now = time.time()
+        key = fingerprint(text, timestamp)
+        with self._lock:
+            cutoff = now - self.window_seconds
+            seen = self._seen
+            while seen:
+                oldest_key = next(iter(seen))
+                if seen[oldest_key] > cutoff:
+                    break
+                del seen[oldest_key]
+
+            if key in seen:
+                self.suppressed += 1
+                _SUPPRESSED.inc()
+                return False
+
+            seen[key] = now
+            while len(seen) > self.max_entries:
+                seen.popitem(last=False)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
@@ -0,0 +1,353 @@
+"""Fan-out of detected tones to independent consumers.
+
+The watcher hands every ToneEvent to Dispatcher.dispatch(), which only
+appends it to each sink's bounded queue and returns. Every Sink has its
+own worker thread, so a slow consumer (the Tk event loop, the speech
+path, a stalled socket) falls behind on its own instead of holding up
+detection or the other sinks. What happens when a sink's queue is full
+is decided per sink by its overflow policy.
+
+Per-sink queue depth, drops and lag (dispatch to handler start) are
+published to metrics.REGISTRY and available from Dispatcher.stats().
+"""
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import applog
+import clock as clock_mod
+import metrics
+import utils
+
+log = applog.get_logger('dispatch')
+
+# Overflow policies.
+DROP_OLDEST = 'drop_oldest'   # make room by discarding the oldest queued event
+DROP_NEWEST = 'drop_newest'   # discard the event being dispatched
+BLOCK = 'block'               # wait up to block_timeout for room, then drop it
+
+_LAG_HISTORY = 200
+
+
+class Sink:
+    """A consumer with its own bounded queue and worker thread.
+
+    name: short label used in logs and metrics.
+    handler(event): called on the worker thread for each event. If the
+        handler has flush() it is called whenever the queue runs empty,
+        and close() is called when the sink stops.
+    maxsize: queue bound.
+    overflow: DROP_OLDEST, DROP_NEWEST or BLOCK.
+    block_timeout: longest a BLOCK sink may hold up dispatch().
+    drain_on_close: whether close() handles what is still queued (True)
+        or drops it (False, for consumers that can't finish anyway).
+    """
+
+    def __init__(self, name, handler, maxsize=256, overflow=DROP_OLDEST, block_timeout=0.05, clock=None,
+                 drain_on_close=True):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.name = name
+        self.handler = handler
+        self.maxsize = max(1, int(maxsize))
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.drain_on_close = drain_on_close
+        self.clock = clock or clock_mod.SYSTEM
+        # (dispatch time, event)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lags = deque(maxlen=_LAG_HISTORY)
+
+        labels = {'sink': name}
+        self._m_lag = metrics.REGISTRY.summary(
+            'tonereader_sink_lag_seconds', 'Time from dispatch to the sink handling an event', labels=labels)
+        self._m_dropped = metrics.REGISTRY.counter(
+            'tonereader_sink_dropped_total', 'Events dropped because the sink queue was full', labels=labels)
+        metrics.REGISTRY.gauge('tonereader_sink_queue_depth', 'Events waiting for the sink',
+                               labels=labels, fn=self.depth)
+
+    def depth(self):
+        return len(self._queue)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop after handling what is already queued (up to `timeout`)."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def close(self, timeout=2.0, drain=None):
+        """Stop the worker and wait for it to exit.
+
+        With drain (drain_on_close if None), events already queued are
+        handled first, for up to `timeout`; otherwise they are discarded
+        straight away. Anything
+        still queued after that is dropped (and counted as dropped), so
+        nothing is handled after close() returns unless the handler is
+        stuck in a call. Returns the number of events dropped.
+        """
+        if drain is None:
+            drain = self.drain_on_close
+        with self._cond:
+            self._stop = True
+            dropped = 0 if drain else self._discard()
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        with self._cond:
+            dropped += self._discard()
+        if self._thread is not None and self._thread.is_alive():
+            log.warning("Sink '%s' still busy after %.1f s; abandoning it", self.name, timeout)
+        return dropped
+
+    def _discard(self):
+        # Caller holds self._cond.
+        n = len(self._queue)
+        if n:
+            self._queue.clear()
+            self.dropped += n
+            self._m_dropped.inc(n)
+        return n
+
+    def put(self, event):
+        """Queue an event; returns False if it was dropped."""
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                if self.overflow == DROP_OLDEST:
+                    self._queue.popleft()
+                    self._drop()
+                elif self.overflow == BLOCK:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.maxsize and not self._stop:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    if len(self._queue) >= self.maxsize:
+                        self._drop()
+                        return False
+                else:
+                    self._drop()
+                    return False
+            self._queue.append((self.clock.time(), event))
+            self._cond.notify_all()
+            return True
+
+    def _drop(self):
+        self.dropped += 1
+        self._m_dropped.inc()
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            log.warning("Sink '%s' is falling behind; %d event(s) dropped so far", self.name, self.dropped)
+
+    def _loop(self):
+        flush = getattr(self.handler, 'flush', None)
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and not self._stop:
+                        self._cond.wait()
+                    if not self._queue:
+                        break
+                    queued_at, event = self._queue.popleft()
+                    # Wake a BLOCK-policy dispatch waiting for room.
+                    self._cond.notify_all()
+                lag = max(0.0, self.clock.time() - queued_at)
+                self.lags.append(lag)
+                self._m_lag.observe(lag)
+                try:
+                    self.handler(event)
+                    self.handled += 1
+                except Exception:
+                    self.errors += 1
+                    log.exception("Sink '%s' failed to handle an event", self.name)
+                if flush is not None and not self._queue:
+                    try:
+                        flush()
+                    except Exception:
+                        log.exception("Sink '%s' flush failed", self.name)
+        finally:
+            close = getattr(self.handler, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'handled': self.handled,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'lag_ms': utils.percentiles([v * 1000.0 for v in self.lags]),
+        }
+
+
+class Dispatcher:
+    """Hands each event to every registered sink's queue."""
+
+    def __init__(self, sinks=()):
+        self._sinks = list(sinks)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def add(self, sink):
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+        return sink
+
+    def remove(self, name):
+        with self._lock:
+            removed = [s for s in self._sinks if s.name == name]
+            self._sinks = [s for s in self._sinks if s.name != name]
+        for s in removed:
+            s.stop()
+
+    def sinks(self):
+        return list(self._sinks)
+
+    def start(self):
+        for s in self._sinks:
+            s.start()
+
+    def stop(self, timeout=2.0):
+        for s in self._sinks:
+            s.stop(timeout)
+
+    def close(self, timeout=2.0, drain=None):
+        """Shut down: stop accepting events, then close every sink (see
+        Sink.close), giving each up to `timeout`. `drain` overrides each
+        sink's drain_on_close. Returns the number of events dropped per
+        sink."""
+        self._closed = True
+        dropped = {s.name: s.close(timeout, drain) for s in self._sinks}
+        if any(dropped.values()):
+            log.info("Dropped on shutdown: %s", ', '.join(f"{k}={v}" for k, v in dropped.items() if v))
+        return dropped
+
+    def dispatch(self, event):
+        """Queue `event` on every sink; never waits on a consumer (except
+        for the bounded wait of BLOCK-policy sinks). Ignored after close()."""
+        if self._closed:
+            return
+        for s in self._sinks:
+            s.put(event)
+
+    __call__ = dispatch
+
+    def stats(self):
+        return {s.name: s.stats() for s in self._sinks}
+
+
+class TranscriptWriter:
+    """Sink handler appending one tab-separated line per event to a file:
+
+        <local time>  <in-game [HH:MM:SS] or ->  <profile or ->  <marker>  <message>
+
+    Lines are buffered and flushed whenever the sink's queue runs empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._f = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, event):
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.detected_at))
+        gt = event.game_time
+        game = f"{gt // 3600:02d}:{gt % 3600 // 60:02d}:{gt % 60:02d}" if gt is not None else '-'
+        message = ' '.join(event.message.split())
+        self._f.write(f"{stamp}\t{game}\t{event.profile or '-'}\t{event.marker or '-'}\t{message}\n")
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        try:
+            self._f.close()
+        except Exception:
+            pass
+
+
+class SocketForwarder:
+    """Sink handler sending each event as a JSON line to a local TCP consumer.
+
+    Connects lazily to 127.0.0.1:port and reconnects (at most every
+    `retry_interval` seconds) if the consumer goes away; events arriving
+    while it is unreachable are dropped. Lines are sent in batches of up
+    to `batch_size`, or sooner when the sink's queue runs empty.
+    """
+
+    def __init__(self, port, host='127.0.0.1', retry_interval=5.0, timeout=2.0, batch_size=100):
+        self.address = (host, port)
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._sock = None
+        self._next_attempt = 0.0
+        self._pending = []
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return None
+        try:
+            self._sock = socket.create_connection(self.address, timeout=self.timeout)
+            log.info("Forwarding tones to %s:%d", *self.address)
+        except OSError as e:
+            self._next_attempt = now + self.retry_interval
+            log.debug("Tone consumer at %s:%d unavailable: %s", self.address[0], self.address[1], e)
+            self._sock = None
+        return self._sock
+
+    def __call__(self, event):
+        self._pending.append(json.dumps({
+            'time': event.detected_at,
+            'game_time': event.game_time,
+            'source': event.source,
+            'profile': event.profile,
+            'marker': event.marker,
+            'message': event.message,
+        }) + '\n')
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        sock = self._sock or self._connect()
+        if sock is None:
+            return
+        try:
+            sock.sendall(''.join(pending).encode('utf-8'))
+        except OSError as e:
+            log.warning("Lost tone consumer at %s:%d: %s", self.address[0], self.address[1], e)
+            self.close()
+            self._next_attempt = time.monotonic() + self.retry_interval
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+            self._sock = None
@@ -0,0 +1,90 @@
+"""ToneEvent: the record passed between pipeline stages.
+
+The watcher creates one ToneEvent per detected marker line and the same
+object travels through `ToneReaderApp.speak` into `TTSWorker`, so each
+stage adds to it instead of re-deriving the marker, source or timing
+from a bare string. The message itself is kept as a span into the raw
+line rather than a separate copy.
+"""
+import time
+
+import utils
+
+
+class ToneEvent:
+    """One detected tone message.
+
+    raw: the full line as read.
+    start, end: span of the message (text after the marker, whitespace
+        trimmed) within `raw`; see `message`.
+    marker: normalised marker id (utils.marker_id), or None.
+    source: file path (or 'feed', 'test', ...) the line came from.
+    profile: .storage profile folder name, when known.
+    detected_at: clock time the line was read.
+    game_time: in-game [HH:MM:SS] as seconds since midnight, or None.
+    priority: speech priority (utils.PRIORITY_*), set by prepare().
+    text: cleaned text for display/dedupe, set by prepare().
+    speech: text handed to the engine (normalized); defaults to `text`.
+    enqueued_at, spoken_at: clock times set by TTSWorker.
+    """
+    __slots__ = ('raw', 'start', 'end', 'marker', 'source', 'profile', 'detected_at',
+                 'game_time', 'priority', 'text', 'speech', 'enqueued_at', 'spoken_at')
+
+    def __init__(self, raw, start=0, end=None, marker=None, source=None, profile=None,
+                 detected_at=None, game_time=None):
+        self.raw = raw
+        self.start = start
+        self.end = len(raw) if end is None else end
+        self.marker = marker
+        self.source = source
+        self.profile = profile
+        self.detected_at = time.time() if detected_at is None else detected_at
+        self.game_time = game_time
+        self.priority = None
+        self.text = None
+        self.speech = None
+        self.enqueued_at = None
+        self.spoken_at = None
+
+    @classmethod
+    def from_match(cls, line, match, source=None, profile=None, detected_at=None):
+        """Build an event from a line and its MARKER_RE match."""
+        start = match.end()
+        end = len(line)
+        while start < end and line[start].isspace():
+            start += 1
+        while end > start and line[end - 1].isspace():
+            end -= 1
+        return cls(line, start, end, utils.match_marker_id(match), source, profile,
+                   detected_at, utils.parse_timestamp(line[:match.start()]))
+
+    @classmethod
+    def from_text(cls, text, source=None, detected_at=None, marker_re=utils.MARKER_RE):
+        """Build an event from free text (Feed Line, Test Tone, enqueue()).
+
+        If the text contains a marker only what follows it is the message;
+        otherwise the whole text is.
+        """
+        m = marker_re.search(text) if marker_re is not None else None
+        if m:
+            return cls.from_match(text, m, source, None, detected_at)
+        stripped = text.strip()
+        start = text.find(stripped) if stripped else 0
+        return cls(text, start, start + len(stripped), None, source, None, detected_at,
+                   utils.parse_timestamp(text))
+
+    @property
+    def message(self):
+        """The message text (after the marker) as a string."""
+        return self.raw[self.start:self.end]
+
+    def prepare(self):
+        """Fill in priority and cleaned text, if not already set."""
+        if self.priority is None:
+            self.priority = utils.message_priority(self.message, self.marker)
+        if self.text is None:
+            self.text = utils.clean_text(self.message, skip_marker=True)
+        return self
+
+    def __repr__(self):
+        return f"ToneEvent({self.message!r}, marker={self.marker!r}, source={self.source!r})"
@@ -0,0 +1,234 @@
+"""Virtual-time harness for the watcher -> TTS pipeline.
+
+Runs a real Watcher and TTSWorker against a temporary `.storage` file,
+with a VirtualClock and a NullEngine, so timing behaviour (the 0.5 s
+poll, the 2 s speak delay, queue timeouts, speech duration) can be
+exercised deterministically without audio or wall-clock waits:
+
+    h = PipelineHarness()
+    h.start()
+    h.tone("Engine 1 respond to a structure fire")
+    h.advance(5.0)
+    assert h.spoken and h.tts.urgent_latencies[0] == SPEAK_DELAY
+    h.stop()
+
+Hours of simulated traffic run in seconds of real time. Running this
+module runs the pipeline checks below (check_*) and exits non-zero if
+any of them fails:
+
+    python harness.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from collections import deque
+
+import utils
+from clock import VirtualClock
+from ttswrapper import NullEngine, TTSWorker
+from watcher import Watcher
+
+# TTSWorker speaks a message this many seconds after it was detected.
+SPEAK_DELAY = 2.0
+
+
+class PipelineHarness:
+    """Watcher + TTSWorker wired together on a VirtualClock.
+
+    start_time: virtual epoch seconds to start at (defaults to now, so
+        in-game [HH:MM:SS] stamps look current).
+    history_lines: how many chat lines the fake game keeps in chat_log;
+        older lines are trimmed from the front like the real client.
+    words_per_minute: simulated speaking rate of the NullEngine.
+    """
+
+    def __init__(self, start_time=None, history_lines=200, words_per_minute=180, workdir=None):
+        self.clock = VirtualClock(start=time.time() if start_time is None else start_time)
+        self._own_dir = workdir is None
+        self.workdir = workdir or tempfile.mkdtemp(prefix='tonereader-sim-')
+        self.path = os.path.join(self.workdir, '.storage')
+        self._history = deque(maxlen=history_lines)
+        self._mtime_ns = 0
+        self._write()
+
+        # (virtual time, text) for every message the watcher detected and
+        # every segment the engine started speaking.
+        self.detected = []
+        self.spoken = []
+
+        self.tts = TTSWorker(
+            clock=self.clock,
+            engine_factory=lambda: NullEngine(self.clock, words_per_minute, on_say=self._on_say),
+        )
+        self.watcher = Watcher(self.path, self._on_message, clock=self.clock)
+
+    def _on_message(self, event):
+        # Enqueue first: once a message shows up in `detected` it is
+        # already on the TTS queue.
+        self.tts.enqueue(event.prepare())
+        self.detected.append((event.detected_at, event.message))
+
+    def _on_say(self, text, t):
+        self.spoken.append((t, text))
+
+    def _write(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'chat_log': ''.join(line + '\n' for line in self._history)}, f)
+        # Stamp the file with virtual time, strictly increasing, so the
+        # watcher sees every rewrite even when inode numbers get reused.
+        self._mtime_ns = max(self._mtime_ns + 1000000, int(self.clock.time() * 1e9))
+        os.utime(tmp, ns=(self._mtime_ns, self._mtime_ns))
+        os.replace(tmp, self.path)
+
+    def start(self):
+        self.tts.start()
+        self.watcher.start()
+        self.clock.attach(self.tts._thread)
+        self.clock.attach(self.watcher._thread)
+        self.clock.settle()
+
+    def chat(self, line):
+        """Append a raw chat line, as the game client would."""
+        self._history.append(line)
+        self._write()
+
+    def tone(self, text, marker=utils.KEYWORD):
+        """Append a station-tone line stamped with the current virtual time."""
+        stamp = time.strftime('%H:%M:%S', time.localtime(self.clock.time()))
+        self.chat(f"[{stamp}] {marker} {text}")
+
+    def advance(self, seconds):
+        self.clock.advance(seconds)
+
+    def stop(self):
+        self.watcher.stop_event.set()
+        self.tts._stop.set()
+        self.clock.close()
+        self.watcher.stop()
+        self.tts.stop()
+        if self._own_dir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# --- pipeline checks ----------------------------------------------------------
+
+def check_first_audio_latency():
+    """A lone tone starts speaking exactly SPEAK_DELAY after detection."""
+    h = PipelineHarness()
+    h.start()
+    try:
+        h.tone("Engine 1 respond to a medical call at the docks")
+        h.advance(10.0)
+        assert len(h.detected) == 1, h.detected
+        assert len(h.spoken) == 1, h.spoken
+        detected_at, spoken_at = h.detected[0][0], h.spoken[0][0]
+        assert spoken_at - detected_at == SPEAK_DELAY, (detected_at, spoken_at)
+        assert list(h.tts.routine_latencies) == [SPEAK_DELAY], h.tts.routine_latencies
+        assert list(h.tts.first_audio_latencies) == [0.0], h.tts.first_audio_latencies
+    finally:
+        h.stop()
+
+
+def check_urgent_preempts_routine():
+    """An urgent tone cuts off a routine one, which is requeued and
+    spoken again after the urgent one."""
+    h = PipelineHarness()
+    h.start()
+    try:
+        routine = "Medic 4 return to quarters " + ' '.join(["and stand by"] * 20)
+        h.tone(routine)
+        h.advance(3.0)
+        assert h.spoken and h.spoken[0][1].startswith("Medic 4"), h.spoken
+        interrupted_at = h.clock.time()
+        h.tone("Engine 2 code 3 structure fire at the docks")
+        h.advance(60.0)
+        texts = [text for _, text in h.spoken]
+        urgent = [i for i, text in enumerate(texts) if "Engine 2" in text]
+        assert len(urgent) == 1, texts
+        i = urgent[0]
+        # Nothing from the routine message played between the interrupt
+        # and the urgent message; it resumed afterwards.
+        assert all(t < interrupted_at for t, _ in h.spoken[:i]), h.spoken
+        assert any("stand by" in text for text in texts[i + 1:]), texts
+        assert len(h.tts.urgent_latencies) == 1, h.tts.urgent_latencies
+        assert h.tts.urgent_latencies[0] == SPEAK_DELAY, h.tts.urgent_latencies
+    finally:
+        h.stop()
+
+
+def check_throughput(n=50):
+    """n tones written one per second are all detected and all spoken."""
+    h = PipelineHarness()
+    h.start()
+    try:
+        for i in range(n):
+            h.tone(f"Unit {i} respond")
+            h.advance(1.0)
+        h.advance(n * 2.0)
+        assert len(h.detected) == n, (len(h.detected), n)
+        detected = [message for _, message in h.detected]
+        for i in range(n):
+            assert any(message.endswith(f"Unit {i} respond") for message in detected), i
+        spoken = ' | '.join(text for _, text in h.spoken)
+        for i in range(n):
+            assert f"Unit {i} respond" in spoken, (i, spoken)
+        assert h.tts._tts_queue.empty()
+    finally:
+        h.stop()
+
+
+def check_injection(n=100):
+    """n tone lines (mixed with chatter) sent through the injection socket
+    are all detected and all spoken."""
+    import inject
+    h = PipelineHarness()
+    address = os.path.join(h.workdir, 'inject.sock') if inject._HAS_AF_UNIX else 0
+    server = inject.InjectionServer(h._on_message, address, clock=h.clock)
+    h.start()
+    server.start()
+    try:
+        lines = []
+        for i in range(n):
+            lines.append(f"Chatter {i} says: nothing to see here")
+            lines.append(f"{utils.KEYWORD} Unit {i} respond")
+        assert inject.send_lines(lines, server.address) == 2 * n
+        # The server's connection thread runs in real time; wait for it.
+        deadline = time.monotonic() + 10.0
+        while len(h.detected) < n and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(h.detected) == n, (len(h.detected), n)
+        h.advance(n * 2.0)
+        spoken = ' | '.join(text for _, text in h.spoken)
+        for i in range(n):
+            assert f"Unit {i} respond" in spoken, (i, spoken)
+    finally:
+        server.stop()
+        h.stop()
+
+
+CHECKS = (check_first_audio_latency, check_urgent_preempts_routine, check_throughput, check_injection)
+
+
+def run_checks(checks=CHECKS):
+    """Run each check; print a line per check and return the failure count."""
+    failures = 0
+    for check in checks:
+        t0 = time.perf_counter()
+        try:
+            check()
+        except Exception:
+            failures += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+        else:
+            print(f"ok   {check.__name__} ({time.perf_counter() - t0:.2f} s)")
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if run_checks() else 0)
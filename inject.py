@@ -0,0 +1,214 @@
+"""Local injection API: feed raw log lines into the running pipeline.
+
+InjectionServer listens on a Unix domain socket (or, where those aren't
+available, e.g. on Windows, on a TCP port bound to 127.0.0.1) and accepts
+newline-delimited raw lines. A client may send one line per write or
+thousands in one batch. Every line goes through the same marker
+detection as a watched log (watcher.scan_line) and matching events go
+to `on_event`, normally the app's Dispatcher, so they are cleaned,
+deduplicated, logged and spoken like game traffic.
+
+Run this module to send lines from a file or stdin to a running
+ToneReader, e.g. for load testing with --null-tts:
+
+    python inject.py [ADDRESS] < lines.txt
+"""
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+import applog
+import clock as clock_mod
+import metrics
+import utils
+from watcher import scan_line
+
+log = applog.get_logger('inject')
+
+_HAS_AF_UNIX = hasattr(socket, 'AF_UNIX')
+
+DEFAULT_PORT = 47800
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'tonereader.sock')
+
+_INJECTED = metrics.REGISTRY.counter(
+    'tonereader_injected_lines_total', 'Raw lines received on the injection socket')
+
+
+def default_address():
+    """Unix socket path where supported, otherwise the default TCP port."""
+    return DEFAULT_SOCKET if _HAS_AF_UNIX else DEFAULT_PORT
+
+
+def parse_address(text):
+    """'47800' or ':47800' -> TCP port; anything else -> Unix socket path."""
+    if text is None or text == '':
+        return default_address()
+    if isinstance(text, int):
+        return text
+    s = str(text).lstrip(':')
+    if s.isdigit():
+        return int(s)
+    return text
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    rbufsize = 64 * 1024
+
+    def handle(self):
+        server = self.server.owner
+        count = 0
+        for raw in self.rfile:
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            count += 1
+            _INJECTED.inc()
+            if line:
+                server.handle_line(line)
+        log.debug("Injection client finished: %d line(s)", count)
+
+
+if _HAS_AF_UNIX:
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _clear_stale_socket(path):
+    """Remove a socket file left behind by a previous run.
+
+    Raises OSError if another instance is still listening on `path`, or if
+    `path` is something other than a socket, rather than taking it over.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1.0)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Nobody is listening: stale.
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return
+    finally:
+        probe.close()
+    raise OSError(f"another ToneReader is already listening on {path}")
+
+
+class InjectionServer:
+    """Accepts raw lines over a local socket and feeds them to `on_event`.
+
+    on_event(event): called with a ToneEvent for every injected line that
+        has a message after a marker (called on the connection's thread).
+    address: Unix socket path, or an int TCP port (0 picks a free one)
+        bound to 127.0.0.1. Defaults to default_address().
+    marker_re: compiled marker regex (utils.MARKER_RE by default).
+    """
+
+    def __init__(self, on_event, address=None, marker_re=None, clock=None):
+        self.on_event = on_event
+        self.address = default_address() if address is None else address
+        self.marker_re = marker_re or utils.MARKER_RE
+        self.clock = clock or clock_mod.SYSTEM
+        self._server = None
+        self._thread = None
+
+    def handle_line(self, line):
+        event = scan_line(line, self.marker_re, 'inject', None, self.clock.time())
+        if event is not None and event.end > event.start:
+            try:
+                self.on_event(event)
+            except Exception:
+                log.exception("Injected line could not be dispatched")
+
+    def start(self):
+        """Start listening; returns the bound address (path or port)."""
+        if isinstance(self.address, int):
+            server = _TCPServer(('127.0.0.1', self.address), _Handler)
+            self.address = server.server_address[1]
+        else:
+            if not _HAS_AF_UNIX:
+                raise OSError("Unix domain sockets are not available here; use a port number")
+            _clear_stale_socket(self.address)
+            server = _UnixServer(self.address, _Handler)
+            try:
+                os.chmod(self.address, 0o600)
+            except OSError:
+                pass
+        server.owner = self
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, name='inject', daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        if self._server is None:
+            return
+        try:
+            self._server.shutdown()
+            self._server.server_close()
+        except Exception:
+            pass
+        if not isinstance(self.address, int):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+        self._server = None
+
+
+def connect(address=None, timeout=5.0):
+    """Open a client connection to an InjectionServer."""
+    address = parse_address(address)
+    if isinstance(address, int):
+        return socket.create_connection(('127.0.0.1', address), timeout=timeout)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(address)
+    return sock
+
+
+def send_lines(lines, address=None, batch_size=1000):
+    """Send an iterable of raw lines; returns the number sent."""
+    sent = 0
+    batch = []
+    with connect(address) as sock:
+        for line in lines:
+            batch.append(line.rstrip('\r\n') + '\n')
+            if len(batch) >= batch_size:
+                sock.sendall(''.join(batch).encode('utf-8'))
+                sent += len(batch)
+                batch = []
+        if batch:
+            sock.sendall(''.join(batch).encode('utf-8'))
+            sent += len(batch)
+    return sent
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    address = parse_address(argv[0] if argv else None)
+    t0 = time.perf_counter()
+    sent = send_lines(sys.stdin, address)
+    elapsed = time.perf_counter() - t0
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    print(f"Sent {sent} line(s) to {address} in {elapsed:.3f} s ({rate:.0f} lines/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Log pane for ToneReader.
+
+Log entries are kept as structured records in a fixed-capacity ring
+buffer (LogRing) and LogView only renders the rows that are currently
+visible, so the pane can hold 100k+ entries with constant memory and
+filtering/scrolling stays fast regardless of history size.
+"""
+import time
+from collections import namedtuple
+
+import tkinter as tk
+from tkinter import ttk
+from tkinter import font as tkfont
+
+# `cont` marks the continuation lines of a multi-line entry (e.g. a
+# traceback); each line is its own record so one record is one row.
+LogRecord = namedtuple('LogRecord', 'seq time level text cont', defaults=(False,))
+
+# Levels shown as filter toggles, in display order. SPOKEN is anything
+# logged without a [TAG] prefix, i.e. the cleaned text that was spoken.
+LEVELS = ('DEBUG', 'INFO', 'WARN', 'READ', 'ERROR', 'SPOKEN')
+
+# Other tags the app uses, folded into one of LEVELS.
+_TAG_LEVELS = {
+    'WARNING': 'WARN',
+    'TEST': 'INFO',
+    'FEED': 'INFO',
+    'SPEAKING': 'INFO',
+    'MANUAL': 'INFO',
+}
+
+# Width of the "[HH:MM:SS] " stamp, used to indent continuation lines.
+_CONT_PREFIX = ' ' * 11
+
+_LEVEL_COLOURS = {
+    'DEBUG': 'gray45',
+    'WARN': 'dark orange',
+    'READ': 'blue4',
+    'ERROR': 'red3',
+}
+
+
+def classify(entry):
+    """Split a log entry into (level, text).
+
+    Entries look like "[DEBUG] something"; the tag is returned as the level
+    and kept in the text. Entries without a tag are SPOKEN.
+    """
+    if entry.startswith('['):
+        end = entry.find(']', 1, 12)
+        if end > 0:
+            tag = entry[1:end].upper()
+            if tag in LEVELS:
+                return tag, entry
+            if tag.isalpha():
+                return _TAG_LEVELS.get(tag, 'INFO'), entry
+    return 'SPOKEN', entry
+
+
+class LogRing:
+    """Fixed-capacity ring buffer of LogRecords.
+
+    Index 0 is the oldest retained record. Every record gets a sequence
+    number that keeps increasing after old records are overwritten, so
+    other structures can refer to records by seq without being rewritten.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = max(1, int(capacity))
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self.next_seq = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def oldest_seq(self):
+        return self.next_seq - self._count
+
+    def append(self, level, text, t=None, cont=False):
+        rec = LogRecord(self.next_seq, time.time() if t is None else t, level, text, cont)
+        self.next_seq += 1
+        if self._count < self.capacity:
+            self._items[(self._start + self._count) % self.capacity] = rec
+            self._count += 1
+        else:
+            self._items[self._start] = rec
+            self._start = (self._start + 1) % self.capacity
+        return rec
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._items[(self._start + i) % self.capacity]
+
+    def by_seq(self, seq):
+        return self[seq - self.oldest_seq]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._items[(self._start + i) % self.capacity]
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+
+
+class LogView(ttk.Frame):
+    """Virtualized, level-filterable view of a LogRing.
+
+    Only the visible rows are ever inserted into the Text widget; the
+    scrollbar is driven manually from the ring size. The view follows new
+    entries while scrolled to the bottom.
+    """
+
+    def __init__(self, master, capacity=100000, font=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.ring = LogRing(capacity)
+        self._enabled = set(LEVELS)
+        # seqs of records matching the filter; only used when filtering.
+        # A list plus start offset so expiring old seqs is O(1).
+        self._filtered = []
+        self._fstart = 0
+        self._top = 0
+        self._follow = True
+        self._render_pending = False
+        self._linespace = None
+
+        bar = ttk.Frame(self)
+        bar.pack(fill='x')
+        ttk.Label(bar, text='Log:').pack(side='left')
+        self._level_vars = {}
+        for level in LEVELS:
+            var = tk.BooleanVar(value=True)
+            self._level_vars[level] = var
+            ttk.Checkbutton(bar, text=level.title(), variable=var,
+                            command=self._on_filter_changed).pack(side='left', padx=(6, 0))
+
+        body = ttk.Frame(self)
+        body.pack(fill='both', expand=True)
+        self.text = tk.Text(body, height=12, wrap='none', state='disabled',
+                            bg='white', fg='black', insertbackground='black')
+        if font is not None:
+            self.text.configure(font=font)
+        self.scrollbar = ttk.Scrollbar(body, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+        # Lines aren't wrapped (one row per entry keeps the windowing
+        # simple), so long entries scroll horizontally.
+        self.xscrollbar = ttk.Scrollbar(body, orient='horizontal', command=self.text.xview)
+        self.xscrollbar.pack(side='bottom', fill='x')
+        self.text.configure(xscrollcommand=self.xscrollbar.set)
+        self.text.pack(side='left', fill='both', expand=True)
+        for level, colour in _LEVEL_COLOURS.items():
+            self.text.tag_configure(level, foreground=colour)
+
+        self.text.bind('<Configure>', lambda e: self._schedule_render())
+        self.text.bind('<MouseWheel>', self._on_wheel)
+        self.text.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        self.text.bind('<Button-5>', lambda e: self._scroll_by(3))
+        for key, delta in (('<Prior>', 'page-'), ('<Next>', 'page+'), ('<Up>', -1), ('<Down>', 1)):
+            self.text.bind(key, lambda e, d=delta: self._on_key(d))
+        self.text.bind('<Home>', lambda e: self._scroll_to(0))
+        self.text.bind('<End>', lambda e: self._scroll_to(self._total()))
+
+    # --- data -----------------------------------------------------------
+    def append(self, entry, t=None):
+        """Add a log entry. Must be called on the Tk main thread.
+
+        A multi-line entry (such as a logged traceback) is stored as one
+        record per line, since the view draws one row per record.
+        """
+        level, text = classify(entry)
+        if '\n' in text:
+            if t is None:
+                t = time.time()
+            for i, line in enumerate(text.splitlines()):
+                self._add(level, line, t, i > 0)
+        else:
+            self._add(level, text, t, False)
+        self._schedule_render()
+
+    def _add(self, level, text, t, cont):
+        rec = self.ring.append(level, text, t, cont)
+        if self._is_filtered():
+            if level in self._enabled:
+                self._filtered.append(rec.seq)
+            self._expire_filtered()
+        elif not self._follow and len(self.ring) == self.ring.capacity:
+            # Oldest record dropped: keep the same records on screen.
+            self._top = max(0, self._top - 1)
+
+    def clear(self):
+        self.ring.clear()
+        self._filtered = []
+        self._fstart = 0
+        self._top = 0
+        self._follow = True
+        self._schedule_render()
+
+    def _is_filtered(self):
+        return len(self._enabled) != len(LEVELS)
+
+    def _expire_filtered(self):
+        oldest = self.ring.oldest_seq
+        f = self._filtered
+        start = self._fstart
+        while start < len(f) and f[start] < oldest:
+            start += 1
+            if not self._follow:
+                self._top = max(0, self._top - 1)
+        if start > 4096 and start * 2 > len(f):
+            del f[:start]
+            start = 0
+        self._fstart = start
+
+    def _total(self):
+        if self._is_filtered():
+            return len(self._filtered) - self._fstart
+        return len(self.ring)
+
+    def _record_at(self, i):
+        if self._is_filtered():
+            return self.ring.by_seq(self._filtered[self._fstart + i])
+        return self.ring[i]
+
+    def _on_filter_changed(self):
+        self._enabled = {lvl for lvl, var in self._level_vars.items() if var.get()}
+        self._fstart = 0
+        if self._is_filtered():
+            enabled = self._enabled
+            self._filtered = [rec.seq for rec in self.ring if rec.level in enabled]
+        else:
+            self._filtered = []
+        self._follow = True
+        self._schedule_render()
+
+    # --- scrolling ------------------------------------------------------
+    def _rows(self):
+        try:
+            if self._linespace is None:
+                self._linespace = tkfont.Font(font=self.text.cget('font')).metrics('linespace') or 16
+            linespace = self._linespace
+            height = self.text.winfo_height()
+        except Exception:
+            return 12
+        if height <= 1:
+            return int(self.text.cget('height'))
+        return max(1, (height - 8) // linespace)
+
+    def _scroll_to(self, top):
+        rows = self._rows()
+        max_top = max(0, self._total() - rows)
+        self._top = max(0, min(int(top), max_top))
+        self._follow = self._top >= max_top
+        self._schedule_render()
+        return 'break'
+
+    def _scroll_by(self, n):
+        return self._scroll_to(self._top + n)
+
+    def _on_key(self, delta):
+        if delta == 'page-':
+            return self._scroll_by(-self._rows())
+        if delta == 'page+':
+            return self._scroll_by(self._rows())
+        return self._scroll_by(delta)
+
+    def _on_wheel(self, event):
+        # Windows/macOS report multiples of 120 (or small ints on macOS).
+        steps = -int(event.delta / 120) if abs(event.delta) >= 120 else -event.delta
+        return self._scroll_by(steps * 3)
+
+    def _on_scrollbar(self, *args):
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self._scroll_to(float(args[1]) * self._total())
+        elif args[0] == 'scroll':
+            n = int(args[1])
+            self._scroll_by(n * self._rows() if args[2] == 'pages' else n)
+
+    # --- rendering ------------------------------------------------------
+    def _schedule_render(self):
+        # Coalesce bursts of appends into one redraw.
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        total = self._total()
+        rows = self._rows()
+        if self._follow:
+            self._top = max(0, total - rows)
+        top = self._top
+        end = min(total, top + rows)
+
+        # Redrawing resets the horizontal position; keep it.
+        xpos = self.text.xview()[0]
+        self.text.configure(state='normal')
+        self.text.delete('1.0', 'end')
+        for i in range(top, end):
+            rec = self._record_at(i)
+            # Continuation lines are indented under the first line's text.
+            prefix = _CONT_PREFIX if rec.cont else time.strftime('[%H:%M:%S] ', time.localtime(rec.time))
+            nl = '\n' if i < end - 1 else ''
+            self.text.insert('end', f"{prefix}{rec.text}{nl}", rec.level)
+        self.text.configure(state='disabled')
+        if xpos:
+            self.text.xview_moveto(xpos)
+
+        if total:
+            self.scrollbar.set(top / total, end / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
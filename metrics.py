@@ -0,0 +1,271 @@
+"""In-process metrics and an optional localhost HTTP endpoint.
+
+The watcher and TTS worker update module-level counters/summaries in
+REGISTRY; they only take a small lock per update. MetricsServer serves
+the registry on 127.0.0.1 in Prometheus text format (/metrics) and as
+JSON (/metrics.json) so several dispatch machines can be monitored
+without looking at each GUI.
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import utils
+
+# Observations kept per summary for percentile calculation.
+_SUMMARY_WINDOW = 1000
+# Seconds of counter history used for the per-second rates in the JSON output.
+_RATE_WINDOW = 60.0
+
+
+def _label_str(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Counter:
+    """Monotonically increasing count."""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self.value = 0
+        # (time, value) samples taken by the registry sampler, for rate().
+        self._samples = deque()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def sample(self, now):
+        self._samples.append((now, self.value))
+        while self._samples and now - self._samples[0][0] > _RATE_WINDOW:
+            self._samples.popleft()
+
+    def rate(self):
+        """Per-second increase over the sampled window (0.0 without history)."""
+        if len(self._samples) < 2:
+            return 0.0
+        (t0, v0), (t1, v1) = self._samples[0], self._samples[-1]
+        return (v1 - v0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def prometheus(self):
+        return [f"{self.name}{_label_str(self.labels)} {self.value}"]
+
+    def snapshot(self):
+        return {'value': self.value, 'rate_per_second': round(self.rate(), 3)}
+
+
+class Gauge:
+    """Point-in-time value, either set explicitly or read from a callable."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), fn=None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return 0
+        return self._value
+
+    def sample(self, now):
+        pass
+
+    def prometheus(self):
+        return [f"{self.name}{_label_str(self.labels)} {self.value}"]
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class Summary:
+    """Count/sum of observations plus percentiles over a recent window."""
+    kind = 'summary'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=_SUMMARY_WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._recent.append(value)
+            self.count += 1
+            self.total += value
+
+    def sample(self, now):
+        pass
+
+    def percentiles(self):
+        with self._lock:
+            recent = list(self._recent)
+        return utils.percentiles(recent)
+
+    def prometheus(self):
+        pct = self.percentiles()
+        lines = []
+        for key, q in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99')):
+            if key in pct:
+                lines.append(f"{self.name}{_label_str(self.labels + (('quantile', q),))} {pct[key]:.6f}")
+        lines.append(f"{self.name}_sum{_label_str(self.labels)} {self.total:.6f}")
+        lines.append(f"{self.name}_count{_label_str(self.labels)} {self.count}")
+        return lines
+
+    def snapshot(self):
+        pct = self.percentiles()
+        pct.pop('count', None)
+        return {'count': self.count, 'sum': round(self.total, 6),
+                **{k: round(v, 6) for k, v in pct.items()}}
+
+
+class Registry:
+    """Collection of named metrics. Registering an existing name/labels
+    pair returns the existing metric (gauges get their callable replaced).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = cls(name, help_text, key[1], **kwargs)
+                self._metrics[key] = metric
+            elif kwargs.get('fn') is not None:
+                metric.fn = kwargs['fn']
+            return metric
+
+    def counter(self, name, help_text, labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=None, fn=None):
+        return self._get(Gauge, name, help_text, labels, fn=fn)
+
+    def summary(self, name, help_text, labels=None):
+        return self._get(Summary, name, help_text, labels)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def sample(self, now=None):
+        now = time.time() if now is None else now
+        for m in self.metrics():
+            m.sample(now)
+
+    def render_prometheus(self):
+        out = []
+        seen = set()
+        for m in sorted(self.metrics(), key=lambda m: (m.name, m.labels)):
+            if m.name not in seen:
+                seen.add(m.name)
+                out.append(f"# HELP {m.name} {m.help}")
+                out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.prometheus())
+        return '\n'.join(out) + '\n'
+
+    def render_json(self):
+        data = {}
+        for m in self.metrics():
+            entry = m.snapshot()
+            if m.labels:
+                data.setdefault(m.name, []).append({'labels': dict(m.labels), **entry})
+            else:
+                data[m.name] = entry
+        return json.dumps({'time': time.time(), 'metrics': data}, indent=2, sort_keys=True)
+
+
+REGISTRY = Registry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path in ('/', '/metrics'):
+            body = self.registry.render_prometheus().encode('utf-8')
+            ctype = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path in ('/metrics.json', '/json'):
+            body = self.registry.render_json().encode('utf-8')
+            ctype = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the app log.
+        pass
+
+
+class MetricsServer:
+    """Serves a Registry over HTTP on 127.0.0.1 only.
+
+    port: TCP port (0 picks a free one; see .port after start()).
+    """
+
+    def __init__(self, port, registry=REGISTRY, sample_interval=1.0):
+        self.registry = registry
+        self.port = port
+        self.sample_interval = sample_interval
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        handler = type('Handler', (_Handler,), {'registry': self.registry})
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+            threading.Thread(target=self._sample_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self.port
+
+    def _sample_loop(self):
+        while not self._stop.is_set():
+            self.registry.sample()
+            self._stop.wait(self.sample_interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            try:
+                self._server.shutdown()
+                self._server.server_close()
+            except Exception:
+                pass
+            self._server = None
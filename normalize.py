@@ -0,0 +1,182 @@
+"""Text normalization for ToneReader.
+
+Expands dispatch codes and abbreviations (e.g. "10-50", "MVA", "LSFD")
+into words before the text is handed to the TTS engine, so the engine
+doesn't read them badly or letter by letter.
+
+The dictionary is a JSON object mapping the written form to the spoken
+form, stored next to the settings file as `tonereader_dictionary.json`.
+It is compiled into a character trie so each message is normalized in a
+single left-to-right pass, regardless of how many entries there are.
+The file is re-read automatically when its modification time changes.
+"""
+import os
+import json
+import threading
+import time
+
+import applog
+import settings
+
+log = applog.get_logger('normalize')
+
+# Built-in entries. The user dictionary is layered on top of these and can
+# override or disable (map to "") any of them.
+DEFAULT_ENTRIES = {
+    '10-4': 'ten four',
+    '10-8': 'ten eight',
+    '10-23': 'ten twenty three',
+    '10-50': 'ten fifty',
+    '10-97': 'ten ninety seven',
+    'MVA': 'motor vehicle accident',
+    'MVC': 'motor vehicle collision',
+    'LSFD': 'Los Santos Fire Department',
+    'LSPD': 'Los Santos Police Department',
+    'LSMC': 'Los Santos Medical Center',
+    'EMS': 'E M S',
+    'ETA': 'E T A',
+    'BLS': 'basic life support',
+    'ALS': 'advanced life support',
+    'RP': 'reporting party',
+    'Ave': 'Avenue',
+    'Blvd': 'Boulevard',
+}
+
+# Value stored under this key in a trie node marks the end of an entry.
+_END = None
+
+# How often (seconds) normalize() is allowed to stat the dictionary file.
+_RELOAD_CHECK_INTERVAL = 2.0
+
+
+def get_dictionary_path():
+    """Return the path of the user abbreviation dictionary."""
+    return os.path.join(os.path.dirname(settings.get_settings_path()), 'tonereader_dictionary.json')
+
+
+def build_trie(entries):
+    """Compile a {written: spoken} mapping into a nested-dict trie.
+
+    Keys are matched case-insensitively, so they are lowercased here.
+    Entries with an empty spoken form are skipped.
+    """
+    root = {}
+    for key, value in entries.items():
+        if not key or not value:
+            continue
+        node = root
+        for ch in key.lower():
+            node = node.setdefault(ch, {})
+        node[_END] = value
+    return root
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+def apply_trie(trie, text):
+    """Replace dictionary entries in `text` using a compiled trie.
+
+    Scans left to right once. At each word start the trie is walked to find
+    the longest entry that also ends on a word boundary; on a match the
+    spoken form is emitted and scanning resumes after it, otherwise the
+    scan moves on to the next word. Text between matches is copied in
+    slices rather than character by character.
+    """
+    if not trie or not text:
+        return text
+    lower = text.lower()
+    n = len(text)
+    out = []
+    copied = 0
+    i = 0
+    while i < n:
+        # Only start matches at word boundaries so "EMS" doesn't fire
+        # inside "ITEMS".
+        if i > 0 and _is_word_char(text[i - 1]) and _is_word_char(text[i]):
+            i += 1
+            continue
+        node = trie
+        j = i
+        match_end = -1
+        match_val = None
+        while j < n:
+            node = node.get(lower[j])
+            if node is None:
+                break
+            j += 1
+            if _END in node and (j == n or not (_is_word_char(text[j - 1]) and _is_word_char(text[j]))):
+                match_end = j
+                match_val = node[_END]
+        if match_end < 0:
+            i += 1
+            continue
+        out.append(text[copied:i])
+        out.append(match_val)
+        copied = i = match_end
+    if not out:
+        return text
+    out.append(text[copied:])
+    return ''.join(out)
+
+
+class Normalizer:
+    """Dictionary-driven text normalizer with hot reload.
+
+    path: JSON dictionary file (defaults to get_dictionary_path()). A
+        missing file just means only DEFAULT_ENTRIES are used.
+    """
+
+    def __init__(self, path=None, defaults=None):
+        self.path = path or get_dictionary_path()
+        self.defaults = DEFAULT_ENTRIES if defaults is None else defaults
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._trie = {}
+        self.entry_count = 0
+        self.reload()
+
+    def reload(self):
+        """Re-read the dictionary file and swap in a freshly compiled trie."""
+        entries = dict(self.defaults)
+        mtime = None
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                entries.update({str(k): str(v) for k, v in data.items()})
+            else:
+                log.warning("Ignoring dictionary %s: expected a JSON object", self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Failed to load dictionary %s: %s", self.path, e)
+
+        trie = build_trie(entries)
+        with self._lock:
+            # Build outside the lock, then swap so normalize() never sees a
+            # half-built trie.
+            self._trie = trie
+            self._mtime = mtime
+            self.entry_count = sum(1 for v in entries.values() if v)
+        log.debug("Loaded %d dictionary entries", self.entry_count)
+
+    def reload_if_changed(self):
+        """Reload when the dictionary file's mtime changed. Cheap to call."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except Exception:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def normalize(self, text):
+        """Return `text` with dictionary entries expanded."""
+        now = time.time()
+        if now >= self._next_check:
+            self._next_check = now + _RELOAD_CHECK_INTERVAL
+            self.reload_if_changed()
+        return apply_trie(self._trie, text)
@@ -0,0 +1,263 @@
+"""On-demand sampling profiler for the background threads.
+
+Profiler samples the stacks of the watcher, TTS and other pipeline
+threads with sys._current_frames() at a fixed interval for a limited
+window, optionally tracing allocations with tracemalloc, then writes a
+report bundle (a directory of text/JSON files). Nothing is hooked while
+it isn't running, so leaving the feature available costs nothing.
+
+A sample whose stack is inside a blocking call (clock sleep/wait/get,
+threading waits, queue gets, select/socket reads) counts as waiting;
+the report breaks each thread's time down into running vs. waiting and
+lists where the waits come from. Blocking inside C code that isn't
+reached through one of those Python functions (time.sleep, the Tk main
+loop) shows up as running at the line that made the call.
+
+Sampling is used rather than cProfile because cProfile only profiles
+the thread that enables it and slows every call while active.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+import applog
+
+log = applog.get_logger('profiler')
+
+# Thread name prefixes profiled by default (see the thread names in
+# watcher.py, ttswrapper.py, audio.py, dispatcher.py and inject.py).
+DEFAULT_THREADS = ('watcher', 'tts', 'audio', 'sink-', 'inject', 'MainThread')
+
+# (module file basename, function) pairs that mean "blocked, not working".
+_WAIT_FUNCS = {
+    ('clock.py', 'sleep'), ('clock.py', 'wait'), ('clock.py', 'get'), ('clock.py', '_block'),
+    ('threading.py', 'wait'), ('threading.py', 'join'), ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'), ('queue.py', 'put'),
+    ('selectors.py', 'select'), ('socket.py', 'readinto'), ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+}
+# Modules skipped when looking for the code that called into a wait.
+_WAIT_MODULES = {'clock.py', 'threading.py', 'queue.py', 'selectors.py', 'socket.py', 'socketserver.py'}
+
+TOP_N = 30
+
+
+def _where(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+def _line(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}({frame.f_code.co_name})"
+
+
+def default_report_dir():
+    """Folder for report bundles: next to the settings file."""
+    try:
+        import settings
+        return os.path.dirname(settings.get_settings_path())
+    except Exception:
+        return os.getcwd()
+
+
+class Profiler:
+    """Samples selected threads for `duration` seconds.
+
+    threads: thread name prefixes to sample (DEFAULT_THREADS).
+    interval: seconds between samples.
+    memory: also trace allocations with tracemalloc (slower).
+    out_dir: where the report bundle folder is created.
+    on_done(path): called from the sampler thread with the bundle path.
+    """
+
+    def __init__(self, duration=30.0, threads=DEFAULT_THREADS, interval=0.005, memory=False,
+                 out_dir=None, on_done=None):
+        self.duration = duration
+        self.threads = tuple(threads)
+        self.interval = interval
+        self.memory = memory
+        self.out_dir = out_dir or default_report_dir()
+        self.on_done = on_done
+        self._stop = threading.Event()
+        self._thread = None
+        self.report_path = None
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.elapsed = 0.0
+        # per thread name: Counter of leaf functions (self time), of
+        # functions anywhere on the stack (total time), of wait sites,
+        # and running/waiting sample counts.
+        self._self = defaultdict(Counter)
+        self._total = defaultdict(Counter)
+        self._waits = defaultdict(Counter)
+        self._state = defaultdict(Counter)
+        self._stacks = Counter()
+        self._started_tracemalloc = False
+        self._snapshot = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return False
+        self._reset()
+        self._stop.clear()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        log.info("Profiling %s for %.0f s", ', '.join(self.threads), self.duration)
+        return True
+
+    def stop(self, timeout=10.0):
+        """End the window early; the report is still written."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        return self.report_path
+
+    def _selected(self):
+        return {t.ident: t.name for t in threading.enumerate()
+                if t.ident is not None and t.name.startswith(self.threads) and t.name != 'profiler'}
+
+    def _sample(self, frames, targets):
+        for ident, name in targets.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            chain = []
+            f = frame
+            while f is not None:
+                chain.append(f)
+                f = f.f_back
+            # stack[0] is the innermost frame.
+            stack = [f.f_code for f in chain]
+            wait_site = None
+            for i, code in enumerate(stack):
+                if (os.path.basename(code.co_filename), code.co_name) in _WAIT_FUNCS:
+                    # Attribute the wait to the line in the first caller
+                    # outside the clock/threading/queue plumbing.
+                    for caller in chain[i + 1:]:
+                        if os.path.basename(caller.f_code.co_filename) not in _WAIT_MODULES:
+                            wait_site = _line(caller)
+                            break
+                    else:
+                        wait_site = _line(chain[i])
+                    break
+            if wait_site is not None:
+                self._state[name]['waiting'] += 1
+                self._waits[name][wait_site] += 1
+                continue
+            self._state[name]['running'] += 1
+            self._self[name][_where(stack[0])] += 1
+            for where in {_where(c) for c in stack}:
+                self._total[name][where] += 1
+            self._stacks[name + ';' + ';'.join(_where(c) for c in reversed(stack))] += 1
+
+    def _run(self):
+        t0 = time.perf_counter()
+        deadline = t0 + self.duration
+        try:
+            while not self._stop.is_set() and time.perf_counter() < deadline:
+                targets = self._selected()
+                self._sample(sys._current_frames(), targets)
+                self.samples += 1
+                self._stop.wait(self.interval)
+            self.elapsed = time.perf_counter() - t0
+            if tracemalloc.is_tracing():
+                self._snapshot = tracemalloc.take_snapshot()
+        except Exception:
+            log.exception("Profiler failed")
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        try:
+            self.report_path = self.write_report()
+            log.info("Profile report written to %s", self.report_path)
+        except Exception:
+            log.exception("Could not write profile report")
+            self.report_path = None
+        if self.on_done is not None:
+            try:
+                self.on_done(self.report_path)
+            except Exception:
+                pass
+
+    # --- reporting ---------------------------------------------------------
+    def write_report(self):
+        """Write the bundle and return its folder path.
+
+        summary.txt   per-thread running/waiting split, top functions by
+                      self and total samples, top wait sites, allocations
+        profile.json  the same counts, machine readable
+        stacks.txt    folded stacks (flamegraph.pl / speedscope input)
+        """
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.out_dir, f"tonereader-profile-{stamp}")
+        os.makedirs(path, exist_ok=True)
+
+        allocations = []
+        if self._snapshot is not None:
+            for stat in self._snapshot.statistics('lineno')[:TOP_N]:
+                frame = stat.traceback[0]
+                allocations.append({'site': f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                                    'size_kb': round(stat.size / 1024.0, 1), 'count': stat.count})
+
+        data = {
+            'duration_s': round(self.elapsed, 3),
+            'interval_s': self.interval,
+            'samples': self.samples,
+            'threads': {},
+            'allocations': allocations,
+        }
+        for name in sorted(set(self._state)):
+            state = self._state[name]
+            n = sum(state.values()) or 1
+            data['threads'][name] = {
+                'samples': sum(state.values()),
+                'running_pct': round(100.0 * state['running'] / n, 1),
+                'waiting_pct': round(100.0 * state['waiting'] / n, 1),
+                'top_self': self._self[name].most_common(TOP_N),
+                'top_total': self._total[name].most_common(TOP_N),
+                'wait_sites': self._waits[name].most_common(TOP_N),
+            }
+
+        with open(os.path.join(path, 'profile.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        with open(os.path.join(path, 'stacks.txt'), 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(path, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(self._summary(data))
+        return path
+
+    def _summary(self, data):
+        ms = self.interval * 1000.0
+        out = [f"ToneReader profile: {data['duration_s']:.1f} s, {data['samples']} samples "
+               f"every {ms:.0f} ms", '']
+        for name, t in data['threads'].items():
+            out.append(f"== {name}: {t['samples']} samples, running {t['running_pct']}%, "
+                       f"waiting {t['waiting_pct']}%")
+            for title, key in (('Top functions (self)', 'top_self'),
+                               ('Top functions (total)', 'top_total'),
+                               ('Wait sites', 'wait_sites')):
+                if t[key]:
+                    out.append(f"  {title}:")
+                    for where, count in t[key][:15]:
+                        out.append(f"    {count:7d}  {count * ms / 1000.0:8.2f}s  {where}")
+            out.append('')
+        if data['allocations']:
+            out.append("== Allocations (live at end of window)")
+            for a in data['allocations']:
+                out.append(f"    {a['size_kb']:10.1f} KB  {a['count']:7d}  {a['site']}")
+        elif self.memory:
+            out.append("== Allocations: none recorded")
+        return '\n'.join(out) + '\n'
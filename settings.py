@@ -1,5 +1,40 @@
 import os
 import json
+import re
+import threading
+import time
+
+import applog
+
+log = applog.get_logger('settings')
+
+# Seconds to wait after the last change before writing the file out.
+# Checkpoints change on every read, so writes are batched.
+CHECKPOINT_DEBOUNCE = 2.0
+
+# Version of the settings file layout; see _migrate().
+SCHEMA_VERSION = 1
+
+# Minimum seconds between mtime checks for external edits.
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def _defaults():
+    return {
+        'version': SCHEMA_VERSION,
+        # Most recently watched file.
+        'last_log': None,
+        # Watched files: checkpoint key -> {'name', 'path', 'last_used'}.
+        'profiles': {},
+        # Extra tone markers: [{'id', 'pattern', 'priority'}]. Empty means
+        # just the built-in utils.MARKER_RE.
+        'markers': [],
+        # TTS parameters (volume 0.0-1.0; rate in words per minute or None
+        # for the engine default; voice id or None).
+        'tts': {'volume': 1.0, 'rate': None, 'voice': None},
+        # Per-file read checkpoints (see watcher.Watcher), by checkpoint key.
+        'checkpoints': {},
+    }
 
 
 def get_settings_path(base=None):
@@ -28,26 +63,341 @@ def get_settings_path(base=None):
     return os.path.join(base, 'tonereader_settings.json')
 
 
+def _read_data(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            if isinstance(data, dict):
+                return data
+    except Exception:
+        pass
+    return {}
+
+
+def _write_atomic(path, data):
+    """Write JSON to a temp file next to `path` and rename it into place.
+
+    A crash mid-write leaves the previous file intact instead of a
+    truncated one.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        try:
+            os.fsync(f.fileno())
+        except Exception:
+            pass
+    os.replace(tmp, path)
+
+
+def _migrate(data):
+    """Bring settings read from disk up to SCHEMA_VERSION.
+
+    Version 0 (no 'version' key) held only last_log and checkpoints; the
+    last log becomes the first profile. Files from a newer version are
+    used as-is, keeping keys this version doesn't know about.
+    """
+    version = data.get('version', 0) if isinstance(data.get('version', 0), int) else 0
+    if version > SCHEMA_VERSION:
+        log.warning("Settings file is from a newer version (%s); unknown keys are kept as-is", version)
+        return data
+    if version < 1:
+        last = data.get('last_log')
+        profiles = data.get('profiles') if isinstance(data.get('profiles'), dict) else {}
+        if last:
+            profiles.setdefault(_checkpoint_key(last), {
+                'name': profile_name(last), 'path': last, 'last_used': None})
+        data['profiles'] = profiles
+    merged = _defaults()
+    for key, value in data.items():
+        if key in merged and isinstance(merged[key], dict) and not isinstance(value, dict):
+            continue
+        if key in merged and isinstance(merged[key], list) and not isinstance(value, list):
+            continue
+        merged[key] = value
+    merged['tts'] = {**_defaults()['tts'], **merged['tts']}
+    merged['version'] = max(version, SCHEMA_VERSION)
+    return merged
+
+
+def _checkpoint_key(log_path):
+    return os.path.normcase(os.path.abspath(log_path))
+
+
+def profile_name(log_path):
+    """Display name for a watched file: the .storage profile folder for
+    client_resources/.storage/<id>/.storage, otherwise the file name."""
+    parent, base = os.path.split(os.path.abspath(log_path))
+    return os.path.basename(parent) if base == '.storage' else base
+
+
+class SettingsStore:
+    """In-memory settings with debounced, atomic write-behind.
+
+    Reads come from memory. Changes mark their top-level key dirty and
+    schedule a write `debounce` seconds later, so a burst of updates
+    (checkpoints on every read) becomes one temp-file-plus-rename write.
+    The file's mtime is checked at most every RELOAD_CHECK_INTERVAL
+    seconds; if another program (or the user) edited it, it's reloaded,
+    and on write any keys changed here are merged over the file's
+    current contents rather than overwriting the edit.
+    """
+
+    def __init__(self, path=None, debounce=CHECKPOINT_DEBOUNCE):
+        self.path = path or get_settings_path()
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        # Serializes flush() calls; held while writing, unlike _lock, so
+        # readers and updaters never wait on the disk.
+        self._write_lock = threading.Lock()
+        self._data = _defaults()
+        self._dirty = set()
+        self._timer = None
+        self._mtime_ns = None
+        self._last_check = 0.0
+        self.load()
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """(Re)read the file, discarding unsaved changes."""
+        with self._lock:
+            mtime = self._stat_mtime()
+            self._data = _migrate(_read_data(self.path)) if mtime is not None else _defaults()
+            self._mtime_ns = mtime
+            self._dirty.clear()
+
+    def reload_if_changed(self, force=False):
+        """Reload if the file changed on disk since we last read/wrote it.
+
+        Cheap to call often: stats the file at most every
+        RELOAD_CHECK_INTERVAL seconds. Returns True if it reloaded.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+        with self._lock:
+            mtime = self._stat_mtime()
+            if mtime is None or mtime == self._mtime_ns:
+                return False
+            pending = {k: self._data.get(k) for k in self._dirty}
+            self.load()
+            # Keep our unsaved changes on top of the external edit.
+            self._data.update(pending)
+            self._dirty.update(pending)
+        log.info("Settings reloaded after an external change: %s", self.path)
+        return True
+
+    def get(self, key, default=None):
+        self.reload_if_changed()
+        with self._lock:
+            value = self._data.get(key, default)
+            if isinstance(value, dict):
+                return dict(value)
+            if isinstance(value, list):
+                return list(value)
+            return value
+
+    def set(self, key, value, debounce=None):
+        with self._lock:
+            self._data[key] = value
+            self._changed(key, debounce)
+
+    def update(self, key, fn, debounce=None):
+        """Call fn(value) to modify a dict/list setting in place."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                value = _defaults().get(key, {})
+                self._data[key] = value
+            fn(value)
+            self._changed(key, debounce)
+
+    def _changed(self, key, debounce):
+        self._dirty.add(key)
+        if self._timer is None:
+            self._timer = threading.Timer(self.debounce if debounce is None else debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write pending changes now (no-op if nothing changed).
+
+        The data is copied under the lock and written without it, so
+        set()/update() from other threads don't wait for the disk. Keys
+        changed while the write is in progress stay dirty and are written
+        by the next (already scheduled) flush.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                keys = set(self._dirty)
+                self._dirty.clear()
+                data = json.loads(json.dumps(self._data))
+                known_mtime = self._mtime_ns
+            merged = None
+            try:
+                mtime = self._stat_mtime()
+                if mtime is not None and mtime != known_mtime:
+                    # Edited on disk since we read it: merge our changes into
+                    # the file's contents instead of overwriting them.
+                    merged = _migrate(_read_data(self.path))
+                    for key in keys:
+                        merged[key] = data.get(key)
+                    data = merged
+                _write_atomic(self.path, data)
+            except Exception as e:
+                log.error("Could not save settings to %s: %s", self.path, e)
+                with self._lock:
+                    self._dirty.update(keys)
+                return
+            with self._lock:
+                self._mtime_ns = self._stat_mtime()
+                if merged is not None:
+                    # Pick up the external edit for keys we didn't change.
+                    for key, value in merged.items():
+                        if key not in keys and key not in self._dirty:
+                            self._data[key] = value
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide SettingsStore (created on first use)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettingsStore()
+        return _store
+
+
+# --- Module-level helpers (delegate to the store) ---------------------------
+
 def load_settings():
     """Return last_log path if present and exists, otherwise None."""
-    path = get_settings_path()
     try:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                last = data.get('last_log')
-                if last and os.path.exists(last):
-                    return last
+        last = get_store().get('last_log')
+        if last and os.path.exists(last):
+            return last
     except Exception:
         pass
     return None
 
 
 def save_settings(last_log_path: str):
-    path = get_settings_path()
+    """Remember `last_log_path` as the last watched file and a profile."""
     try:
-        data = {'last_log': last_log_path}
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f)
+        store = get_store()
+        store.set('last_log', last_log_path)
+        key = _checkpoint_key(last_log_path)
+        store.update('profiles', lambda profiles: profiles.__setitem__(key, {
+            'name': profile_name(last_log_path), 'path': last_log_path, 'last_used': time.time()}))
     except Exception:
         pass
+
+
+def list_profiles():
+    """Watched files, most recently used first: [{'name', 'path', 'last_used'}]."""
+    profiles = get_store().get('profiles', {})
+    return sorted((p for p in profiles.values() if isinstance(p, dict)),
+                  key=lambda p: p.get('last_used') or 0, reverse=True)
+
+
+def get_tts():
+    return get_store().get('tts', {})
+
+
+def set_tts(**params):
+    """Update TTS parameters (volume, rate, voice)."""
+    get_store().update('tts', lambda tts: tts.update(params))
+
+
+def marker_definitions():
+    return [m for m in get_store().get('markers', []) if isinstance(m, dict) and m.get('pattern')]
+
+
+def _marker_key(marker_id):
+    return ' '.join(str(marker_id).split()).upper()
+
+
+def compile_markers(base=None):
+    """Combine `base` (utils.MARKER_RE by default) with the configured markers.
+
+    Returns (regex, groups): each configured pattern is a named group of
+    the regex and `groups` maps the group names to the configured ids (for
+    utils.MARKER_GROUP_IDS), so a match is tagged with the marker's id
+    rather than its matched text. Returns (None, {}) if no extra markers
+    are configured.
+    """
+    extra = []
+    groups = {}
+    for m in marker_definitions():
+        try:
+            re.compile(m['pattern'])
+        except re.error as e:
+            log.error("Ignoring marker %s with invalid pattern %r: %s", m.get('id'), m['pattern'], e)
+            continue
+        name = f"marker{len(extra)}"
+        extra.append(f"(?P<{name}>{m['pattern']})")
+        if m.get('id') is not None:
+            groups[name] = _marker_key(m['id'])
+    if not extra:
+        return None, {}
+    if base is None:
+        import utils
+        base = utils.MARKER_RE
+    return re.compile('|'.join([f"(?:{base.pattern})"] + extra), re.IGNORECASE), groups
+
+
+def marker_regex(base=None):
+    """Compiled regex matching `base` or any configured marker, or None if
+    no extra markers are configured (see compile_markers)."""
+    return compile_markers(base)[0]
+
+
+def marker_priorities():
+    """{marker id: priority} for configured markers, keyed like the ids
+    compile_markers() assigns."""
+    out = {}
+    for m in marker_definitions():
+        if m.get('id') is not None and isinstance(m.get('priority'), int):
+            out[_marker_key(m['id'])] = m['priority']
+    return out
+
+
+def load_checkpoint(log_path):
+    """Return the saved read checkpoint (a dict) for `log_path`, or None."""
+    cp = get_store().get('checkpoints', {}).get(_checkpoint_key(log_path))
+    return dict(cp) if isinstance(cp, dict) else None
+
+
+def save_checkpoint(log_path, checkpoint, debounce=CHECKPOINT_DEBOUNCE):
+    """Queue a read checkpoint for `log_path` to be written.
+
+    Updates within `debounce` seconds of each other are coalesced into a
+    single atomic write. Call flush() on shutdown.
+    """
+    key = _checkpoint_key(log_path)
+    get_store().update('checkpoints', lambda cps: cps.__setitem__(key, dict(checkpoint)), debounce)
+
+
+def flush():
+    """Write any pending settings changes now."""
+    if _store is not None:
+        _store.flush()
+
+
+# Kept for callers written before the store existed.
+flush_checkpoints = flush
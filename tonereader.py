@@ -1,17 +1,29 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from tkinter.scrolledtext import ScrolledText
 from tkinter import font as tkfont
 from tkinter import simpledialog
 import time
 import os
+import argparse
+import logging
 import re
 import threading
 import queue
 import json
+from collections import deque
 import pyttsx3
+import applog
+import audio
+import metrics
 import utils
 import settings
+import normalize
+import profiler
+import dedupe
+import dispatcher
+import inject
+from events import ToneEvent
+from logview import LogView
 
 # Try to import pythoncom for proper COM initialization on Windows threads.
 # If it's missing we'll continue but the user should install pywin32 for best results.
@@ -22,12 +34,35 @@ except Exception:
     pythoncom = None
     _HAS_PYTHONCOM = False
 
+log = applog.get_logger('app')
+
 # config constants and helpers are in utils
 KEYWORD = utils.KEYWORD
 MARKER_RE = utils.MARKER_RE
 
+# When resuming from a read checkpoint, don't replay tones older than this
+# (seconds, by their in-game [HH:MM:SS] timestamp).
+REPLAY_SECONDS = 120
+
+# Identical messages within this many seconds are only spoken once.
+DEDUPE_WINDOW_SECONDS = 30
+
+# Number of log entries kept for the log pane.
+LOG_CAPACITY = 100000
+
+# Default length of a profiling window started from the Tools menu (seconds).
+PROFILE_SECONDS = 30
+
+# Messages that may wait in the TTS worker's queue. Beyond that, tones
+# back up in the dispatcher's "tts" sink, which sheds the oldest.
+TTS_QUEUE_SIZE = 32
+
+# Entries shown under File > Recent.
+RECENT_PROFILES = 10
+
 class ToneReaderApp:
-    def __init__(self, root):
+    def __init__(self, root, transcript_path=None, forward_port=None, inject_address=None, null_tts=False,
+                 audio_out=None, profile_seconds=None, profile_memory=False):
         self.root = root
         self.root.title("RAGE Tone Reader")
         self.root.geometry("700x320")
@@ -35,15 +70,37 @@ class ToneReaderApp:
         # --- class variables ---
         self.log_file_path = tk.StringVar()
         self.status_text = tk.StringVar()
-        self.current_volume = tk.DoubleVar(value=1.0)
+        try:
+            tts_settings = settings.get_tts()
+        except Exception:
+            tts_settings = {}
+        self.current_volume = tk.DoubleVar(value=tts_settings.get('volume', 1.0))
+        # Last volume seen by the TTS thread (see _tts_volume).
+        self._volume = self.current_volume.get()
         self.watch_thread = None
         self.watcher = None
         self.stop_event = threading.Event()
+        self._status_lock = threading.Lock()
+        self._pending_status = None
+        self._status_scheduled = False
+
+        # Marker pattern: the built-in one plus any markers configured in
+        # the settings file.
+        try:
+            marker_re, marker_groups = settings.compile_markers(MARKER_RE)
+            self.marker_re = marker_re or MARKER_RE
+            utils.MARKER_GROUP_IDS.update(marker_groups)
+            utils.MARKER_PRIORITIES.update(settings.marker_priorities())
+        except Exception:
+            self.marker_re = MARKER_RE
 
         # TTS worker encapsulated in a separate module for readability.
         try:
-            from ttswrapper import TTSWorker
-            self.tts = TTSWorker(self.current_volume.get)
+            from ttswrapper import TTSWorker, NullEngine
+            self.tts = TTSWorker(self._tts_volume, queue_maxsize=TTS_QUEUE_SIZE,
+                                 engine_factory=NullEngine if null_tts else None,
+                                 audio_stream=self._build_audio_stream(audio_out),
+                                 engine_properties=self._tts_properties)
             self.tts.start()
         except Exception:
             # Fallback: if the module isn't available for any reason, expose
@@ -51,10 +108,37 @@ class ToneReaderApp:
             # without crashing. This should not normally happen.
             self.tts = None
 
+        # Suppresses repeats of recently spoken messages (resent lines,
+        # .storage rewrites, Feed Line replays).
+        self.dedupe = dedupe.DedupeWindow(DEDUPE_WINDOW_SECONDS)
+
         # track last seen chat_log (for .storage JSON files) so we only speak new lines
         self._last_chat_log = None
 
         self.create_widgets()
+        # Expands dispatch codes/abbreviations before speaking; reloads the
+        # user dictionary automatically when the file changes.
+        self.normalizer = normalize.Normalizer()
+
+        # Detected tones fan out from here to each consumer on its own
+        # queue/thread, so a slow one (speech, the Tk loop, a file or
+        # socket) can't hold up the watcher or the others.
+        self.dispatcher = self._build_dispatcher(transcript_path, forward_port)
+        self.dispatcher.start()
+
+        # Optional local socket that feeds raw lines into the dispatcher.
+        self.injector = None
+        if inject_address is not None:
+            try:
+                self.injector = inject.InjectionServer(self.dispatcher.dispatch, inject.parse_address(inject_address),
+                                                       marker_re=self.marker_re)
+                address = self.injector.start()
+                log.info("Accepting injected lines on %s", address if not isinstance(address, int)
+                         else f"127.0.0.1:{address}")
+            except Exception as e:
+                log.error("Could not start injection listener: %s", e)
+                self.injector = None
+
         # Load last-used log from settings file (if any)
         try:
             last = settings.load_settings()
@@ -65,11 +149,27 @@ class ToneReaderApp:
             pass
 
         self.status_text.set("Ready. Select a RAGEMP folder and press Start.")
+
+        # On-demand profiler (Tools menu / --profile); idle until started.
+        self.profiler = None
+        self.profile_memory = profile_memory
+        if profile_seconds:
+            self.start_profiling(profile_seconds)
         if not _HAS_PYTHONCOM:
             # warn in UI so user knows COM init support is missing (Windows only)
             self.add_log_entry("[WARN] pythoncom not available. If you are on Windows and TTS is unreliable or not working, install pywin32.")
 
     def create_widgets(self):
+        menubar = tk.Menu(self.root)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self._fill_recent_menu)
+        file_menu.add_cascade(label="Recent", menu=self.recent_menu)
+        menubar.add_cascade(label="File", menu=file_menu)
+        self.tools_menu = tk.Menu(menubar, tearoff=0)
+        self.tools_menu.add_command(label=f"Start Profiling ({PROFILE_SECONDS} s)", command=self.toggle_profiling)
+        menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.root.config(menu=menubar)
+
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.pack(fill="both", expand=True)
 
@@ -102,25 +202,23 @@ class ToneReaderApp:
         self.append_button = ttk.Button(button_frame, text="Append Log", command=lambda: self.add_log_entry("[MANUAL] Manual entry"))
         self.append_button.pack(side="left", padx=5)
 
-        log_frame = ttk.Frame(main_frame)
-        log_frame.pack(fill="both", expand=True, pady=(0,5))
-        ttk.Label(log_frame, text="Log:").pack(anchor="w")
-        self.log_pane = ScrolledText(log_frame, height=12, state='disabled', wrap='word')
         try:
             font = tkfont.Font(family='Consolas', size=11)
-            self.log_pane.configure(font=font)
-        except Exception:
-            pass
-        self.log_pane.pack(fill="both", expand=True)
-        try:
-            self.log_pane.configure(bg='white', fg='black', insertbackground='black')
         except Exception:
-            pass
+            font = None
+        # Log entries live in a ring buffer; the view only renders what's visible.
+        self.log_view = LogView(main_frame, capacity=LOG_CAPACITY, font=font)
+        self.log_view.pack(fill="both", expand=True, pady=(0,5))
+        # Log records arrive on the logging listener thread; batch them and
+        # hand them to the view on the Tk thread.
+        self._pending_log = deque()
+        self._log_flush_scheduled = False
+        self._log_lock = threading.Lock()
+        self._log_sink = applog.add_sink(self._on_log_record)
 
         status_bar = ttk.Label(self.root, textvariable=self.status_text, relief="sunken", anchor="w", padding="5")
         status_bar.pack(side="bottom", fill="x")
 
-        self._max_log_lines = 200
         self._tts_lock = threading.Lock()
 
         try:
@@ -128,6 +226,34 @@ class ToneReaderApp:
         except Exception:
             pass
 
+    def _fill_recent_menu(self):
+        """Rebuild File > Recent from the saved profiles each time it opens."""
+        self.recent_menu.delete(0, 'end')
+        try:
+            profiles = settings.list_profiles()[:RECENT_PROFILES]
+        except Exception:
+            profiles = []
+        # Like Browse, switching files is only allowed while stopped.
+        state = 'disabled' if str(self.browse_button.cget('state')) == 'disabled' else 'normal'
+        for p in profiles:
+            path = p.get('path')
+            self.recent_menu.add_command(label=f"{p.get('name') or path}  ({path})", state=state,
+                                         command=lambda path=path: self.open_profile(path))
+        if not profiles:
+            self.recent_menu.add_command(label="(none)", state='disabled')
+
+    def open_profile(self, path):
+        """Select a previously watched file (File > Recent)."""
+        if not path or not os.path.exists(path):
+            self.status_text.set(f"Error: Log file not found: {path}")
+            return
+        self.log_file_path.set(path)
+        self.status_text.set(f"Selected {settings.profile_name(path)}. Ready to start.")
+        try:
+            settings.save_settings(path)
+        except Exception:
+            pass
+
     def browse_file(self):
         selected_dir = filedialog.askdirectory(title="Select your RAGEMP folder (parent of clientdata)")
         if not selected_dir:
@@ -201,7 +327,10 @@ class ToneReaderApp:
         if found:
             self.log_file_path.set(found)
             self.status_text.set(f"Found log: {found}")
-            self.save_settings()
+            try:
+                settings.save_settings(found)
+            except Exception:
+                pass
             return
 
         if messagebox.askyesno("Log not found", "No console file found in the selected folder's clientdata. Do you want to select a log file manually?"):
@@ -222,43 +351,36 @@ class ToneReaderApp:
         self.status_text.set("No log file selected. Please choose a RAGEMP folder with clientdata/console.txt.")
 
     def add_log_entry(self, entry):
-        def _append():
-            try:
-                timestamp = time.strftime("%H:%M:%S")
-                line = f"[{timestamp}] {entry.strip()}\n"
-                self.log_pane.config(state='normal')
-                self.log_pane.insert('end', line)
-                try:
-                    total_lines = int(self.log_pane.index('end-1c').split('.')[0])
-                except Exception:
-                    total_lines = 0
-                if total_lines > self._max_log_lines:
-                    delete_to = total_lines - self._max_log_lines + 1
-                    try:
-                        self.log_pane.delete('1.0', f"{delete_to}.0")
-                    except Exception:
-                        print("[WARN] Failed to trim log pane")
-                self.log_pane.see('end')
-                self.log_pane.config(state='disabled')
-                try:
-                    self.log_pane.update_idletasks()
-                except Exception:
-                    pass
-                print(f"[LOG] {entry}")
-            except Exception:
-                import traceback
-                print("[ERROR] add_log_entry failed:")
-                traceback.print_exc()
+        """Log a pre-tagged entry such as "[INFO] Ready". Thread-safe.
+
+        The level is taken from the tag (untagged entries are spoken text),
+        so entries below the configured level are dropped cheaply.
+        """
+        log.log(applog.level_for_entry(entry), "%s", entry.strip(), extra={'tagged': True})
 
+    def _on_log_record(self, entry, created):
+        # Called on the logging listener thread.
+        with self._log_lock:
+            self._pending_log.append((entry, created))
+            if self._log_flush_scheduled:
+                return
+            self._log_flush_scheduled = True
         try:
-            if threading.current_thread() is threading.main_thread():
-                _append()
-            else:
-                self.root.after(0, _append)
+            self.root.after(0, self._flush_log)
         except Exception:
-            import traceback
-            print("[ERROR] Scheduling add_log_entry failed:")
-            traceback.print_exc()
+            with self._log_lock:
+                self._log_flush_scheduled = False
+
+    def _flush_log(self):
+        with self._log_lock:
+            pending = self._pending_log
+            self._pending_log = deque()
+            self._log_flush_scheduled = False
+        for entry, created in pending:
+            try:
+                self.log_view.append(entry, created)
+            except Exception:
+                log.debug("Failed to append log entry", exc_info=True)
 
     def _ask_pick_from_list(self, title, prompt, options):
         """Show a small modal dialog with a listbox to pick one option.
@@ -314,11 +436,34 @@ class ToneReaderApp:
         self.root.wait_window(dlg)
         return result['choice']
 
+    def toggle_profiling(self):
+        if self.profiler is not None and self.profiler.running:
+            self.status_text.set("Finishing profile...")
+            threading.Thread(target=self.profiler.stop, daemon=True).start()
+        else:
+            self.start_profiling(PROFILE_SECONDS)
+
+    def start_profiling(self, seconds):
+        """Sample the background threads for `seconds`, then write a report."""
+        self.profiler = profiler.Profiler(
+            duration=seconds, memory=self.profile_memory,
+            on_done=lambda path: self.root.after(0, self._profiling_done, path))
+        self.profiler.start()
+        self.tools_menu.entryconfig(0, label="Stop Profiling")
+        self.add_log_entry(f"[INFO] Profiling for {seconds:.0f} s...")
+
+    def _profiling_done(self, path):
+        self.tools_menu.entryconfig(0, label=f"Start Profiling ({PROFILE_SECONDS} s)")
+        if path:
+            self.status_text.set(f"Profile saved to {path}")
+        else:
+            self.status_text.set("Profiling failed; see log.")
+
     def test_tone(self):
         test_line = f"[{time.strftime('%H:%M:%S')}] {KEYWORD} Test tone"
         self.add_log_entry("[TEST] Triggering test tone")
         # Use cleaned speak call (we pass raw including KEYWORD, speak will clean it)
-        self.speak(test_line)
+        self.speak(test_line, dedupe=False)
 
     def feed_line(self):
         """Prompt the user to paste a raw line exactly as it appears in-game
@@ -334,22 +479,18 @@ class ToneReaderApp:
                 self.add_log_entry(f"[FEED] {s}")
             except Exception:
                 pass
-            # If there's a marker, extract after it; otherwise pass whole line
-            m = MARKER_RE.search(s)
-            if m:
-                extracted = s[m.end():].strip()
-            else:
-                extracted = s.strip()
-            if extracted:
+            # If there's a marker, the message is what follows it;
+            # otherwise the whole line is
+            event = ToneEvent.from_text(s, source='feed', marker_re=self.marker_re)
+            if event.end > event.start:
                 # Also log what will be spoken
                 try:
-                    self.add_log_entry(f"[SPEAKING] {extracted}")
+                    self.add_log_entry(f"[SPEAKING] {event.message}")
                 except Exception:
                     pass
-                self.speak(extracted)
+                self.speak(event)
         except Exception:
-            import traceback
-            traceback.print_exc()
+            log.exception("Feed line failed")
 
     def settings_path(self):
         # Left for backward-compat; recommend using settings.get_settings_path()
@@ -372,6 +513,31 @@ class ToneReaderApp:
         except Exception:
             pass
 
+    def _tts_volume(self):
+        """Volume for the next message (TTS thread).
+
+        Read from the settings store, which the slider writes to and which
+        picks up edits to the settings file; an external change is also
+        reflected on the slider.
+        """
+        try:
+            vol = float(settings.get_tts().get('volume'))
+        except Exception:
+            return self._volume
+        if vol != self._volume:
+            self._volume = vol
+            try:
+                self.root.after(0, self.current_volume.set, vol)
+            except Exception:
+                pass
+        return vol
+
+    def _tts_properties(self):
+        """Engine rate/voice for the next message (TTS thread), re-read so
+        edits to the settings file apply without a restart."""
+        tts = settings.get_tts()
+        return {'rate': tts.get('rate'), 'voice': tts.get('voice')}
+
     def set_volume(self, val):
         """Try to set volume on the worker's engine if available; otherwise just keep var updated."""
         try:
@@ -379,6 +545,9 @@ class ToneReaderApp:
             vol = self.current_volume.get()
             if vol is None:
                 return
+            # Remembered for next start (written out after the slider settles).
+            self._volume = round(vol, 3)
+            settings.set_tts(volume=self._volume)
             # If worker has a live engine pointer, attempt to update its property.
             # This may silently fail if engine is None or not accessible.
             try:
@@ -413,20 +582,100 @@ class ToneReaderApp:
         # Use Watcher class to follow the file in a background thread.
         try:
             from watcher import Watcher
-            # on_message will be called from watcher thread; schedule speak on main thread
-            def _on_message(msg):
-                try:
-                    self.root.after(0, self.speak, msg)
-                except Exception:
-                    pass
-
-            self.watcher = Watcher(log_path, _on_message, self.add_log_entry, MARKER_RE, stop_event=self.stop_event)
+            # on_message is called from the watcher thread; the dispatcher
+            # only queues the event for each sink and returns.
+            self.watcher = Watcher(log_path, self.dispatcher.dispatch, marker_re=self.marker_re, stop_event=self.stop_event,
+                                   **self._checkpoint_kwargs(log_path))
             self.watcher.start()
         except Exception:
             # Fallback to legacy thread method if watcher import fails
-            self.watch_thread = threading.Thread(target=self.follow_file_thread, daemon=True)
+            self.watch_thread = threading.Thread(target=self.follow_file_thread, name='watcher', daemon=True)
             self.watch_thread.start()
 
+    def _build_audio_stream(self, audio_out):
+        """PCMStream for --audio-out ('device' or a .wav path), or None to
+        let each engine play directly."""
+        if not audio_out:
+            return None
+        try:
+            if audio_out == 'device':
+                return audio.PCMStream(audio.DeviceSink())
+            # Only write the speech to a file; idle silence would grow it
+            # without bound over a long session.
+            return audio.PCMStream(audio.WavSink(audio_out), realtime=False)
+        except Exception as e:
+            log.error("Could not open audio output %s (%s); using direct engine playback", audio_out, e)
+            return None
+
+    def _build_dispatcher(self, transcript_path=None, forward_port=None):
+        """Create the dispatcher with the TTS and GUI sinks, plus the
+        transcript file and socket sinks if configured."""
+        d = dispatcher.Dispatcher()
+        # The tts sink waits for room in the (bounded) TTS queue, so when
+        # speech can't keep up the backlog builds here and the stalest
+        # tones are shed first.
+        # Nothing more is spoken once the app is closing, so tones still
+        # queued then are dropped (and counted) rather than drained.
+        d.add(dispatcher.Sink('tts', self._speak_dispatched, maxsize=256, overflow=dispatcher.DROP_OLDEST,
+                              drain_on_close=False))
+        # The status bar only shows the latest tone (see _set_status).
+        d.add(dispatcher.Sink('gui', self._show_tone, maxsize=64, overflow=dispatcher.DROP_OLDEST))
+        if transcript_path:
+            try:
+                d.add(dispatcher.Sink('transcript', dispatcher.TranscriptWriter(transcript_path),
+                                      maxsize=4096, overflow=dispatcher.BLOCK))
+                log.info("Writing transcript to %s", transcript_path)
+            except Exception as e:
+                log.error("Could not open transcript %s: %s", transcript_path, e)
+        if forward_port:
+            d.add(dispatcher.Sink('socket', dispatcher.SocketForwarder(forward_port),
+                                  maxsize=1024, overflow=dispatcher.DROP_OLDEST))
+        return d
+
+    def _speak_dispatched(self, event):
+        """TTS sink: like speak(), but waits for room in the TTS queue."""
+        self.speak(event, block=True)
+
+    def _show_tone(self, event):
+        """GUI sink: show the latest tone in the status bar."""
+        stamp = time.strftime('%H:%M:%S', time.localtime(event.detected_at))
+        self._set_status(f"Status: Watching - last tone {stamp}: {event.message}")
+
+    def _set_status(self, text):
+        """Set the status bar text from any thread.
+
+        Only the latest text is kept and at most one Tk callback is
+        pending, so a burst of updates can't flood the Tk event queue.
+        """
+        with self._status_lock:
+            self._pending_status = text
+            if self._status_scheduled:
+                return
+            self._status_scheduled = True
+        try:
+            self.root.after(0, self._apply_status)
+        except Exception:
+            with self._status_lock:
+                self._status_scheduled = False
+
+    def _apply_status(self):
+        with self._status_lock:
+            text = self._pending_status
+            self._status_scheduled = False
+        self.status_text.set(text)
+
+    def _checkpoint_kwargs(self, log_path):
+        """Watcher arguments for resuming from / persisting read checkpoints."""
+        try:
+            checkpoint = settings.load_checkpoint(log_path)
+        except Exception:
+            checkpoint = None
+        return {
+            'checkpoint': checkpoint,
+            'save_checkpoint': lambda cp: settings.save_checkpoint(log_path, cp),
+            'replay_seconds': REPLAY_SECONDS,
+        }
+
     def stop_watching(self, status_message=None):
         if status_message:
             self.status_text.set(status_message)
@@ -446,6 +695,17 @@ class ToneReaderApp:
         except Exception:
             pass
         self.stop_event.set()
+        try:
+            settings.flush()
+        except Exception:
+            pass
+        for name, st in self.dispatcher.stats().items():
+            log.debug("Sink %s: %d handled, %d dropped, lag %s", name, st['handled'], st['dropped'], st['lag_ms'])
+        if self.tts is not None:
+            for name, pct in self.tts.latency_stats().items():
+                if pct.get('count'):
+                    log.info("TTS %s: p50 %.0f, p90 %.0f, p99 %.0f (n=%d)",
+                             name, pct['p50'], pct['p90'], pct['p99'], pct['count'])
 
     def follow_file_thread(self):
         # Delegate to watcher implementation (short wrapper). The heavy
@@ -457,13 +717,8 @@ class ToneReaderApp:
 
             # Use the Watcher._run() directly here because we're already
             # running inside a dedicated thread when this fallback is used.
-            def _on_message(msg):
-                try:
-                    self.root.after(0, self.speak, msg)
-                except Exception:
-                    pass
-
-            w = Watcher(log_path, _on_message, self.add_log_entry, MARKER_RE, stop_event=self.stop_event)
+            w = Watcher(log_path, self.dispatcher.dispatch, marker_re=self.marker_re, stop_event=self.stop_event,
+                        **self._checkpoint_kwargs(log_path))
             # Run the watch loop in this thread (blocking) as a fallback.
             w._run()
         except Exception:
@@ -475,44 +730,69 @@ class ToneReaderApp:
     def handle_thread_error(self, message):
         self.stop_watching(status_message=message)
 
-    def speak(self, text):
-        """Cleans text and enqueues for the worker to speak."""
+    def speak(self, text, dedupe=True, block=False):
+        """Cleans text and enqueues for the worker to speak.
+
+        `text` is a ToneEvent from the watcher or a raw line (Test Tone);
+        a raw line is turned into an event first. Set dedupe=False to skip
+        duplicate suppression (e.g. Test Tone). With block, wait for room
+        if the TTS queue is full instead of dropping the message (never
+        on the Tk thread).
+        """
         if self.stop_event.is_set():
             return
 
-        # Use centralized cleaner (removes marker, timestamps, and keyword)
-        clean_text = utils.clean_text(text)
+        if isinstance(text, ToneEvent):
+            event = text
+        else:
+            event = ToneEvent.from_text(text, source='manual', marker_re=self.marker_re)
+
+        # Priority and cleaned text are worked out from the event's marker
+        # and message span, so the marker isn't searched for again.
+        event.prepare()
+        clean_text = event.text
 
         if not clean_text:
             return
 
+        if dedupe and not self.dedupe.check(clean_text, event.game_time):
+            log.debug("Suppressed duplicate (%d so far): %s", self.dedupe.suppressed, clean_text)
+            return
+
         # Log it
         try:
             self.add_log_entry(clean_text)
         except Exception:
             pass
 
-        # Put into TTS queue together with an enqueue timestamp so the
-        # worker can delay speaking by ~2 seconds from the time the line
-        # was read. We put a tuple (text, ts) for robust timing.
+        # Expand codes/abbreviations for the engine (the log keeps the
+        # text as written).
+        try:
+            spoken_text = self.normalizer.normalize(clean_text)
+        except Exception:
+            spoken_text = clean_text
+        event.speech = spoken_text
+
+        # Hand the event to the TTS queue; the worker delays speaking by
+        # ~2 seconds from the time the line was read (event.detected_at).
         try:
             if getattr(self, 'tts', None) is not None:
-                self.tts.enqueue(clean_text, time.time())
+                self.tts.enqueue(event, block=block)
             else:
                 # If TTS worker missing, attempt to use pyttsx3 directly as a best-effort.
                 try:
                     eng = pyttsx3.init()
                     eng.setProperty('volume', self.current_volume.get())
-                    eng.say(clean_text)
+                    eng.say(spoken_text)
                     eng.runAndWait()
                     try:
                         eng.stop()
                     except Exception:
                         pass
                 except Exception as e:
-                    self.status_text.set(f"TTS error: {e}")
+                    self._set_status(f"TTS error: {e}")
         except Exception as e:
-            self.status_text.set(f"TTS queue error: {e}")
+            self._set_status(f"TTS queue error: {e}")
 
     def _tts_worker_loop(self):
         """
@@ -538,22 +818,85 @@ class ToneReaderApp:
 
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to exit?"):
-            self.stop_event.set()
             try:
-                self._stop_tts_worker()
-                # Stop watcher if present
+                # Stop the event sources first, then close the dispatcher:
+                # the transcript/socket sinks finish what they were handed,
+                # while tones still waiting to be spoken are dropped and
+                # counted as drops (the tts sink doesn't drain, since
+                # speak() ignores everything once stop_event is set).
                 try:
                     if getattr(self, 'watcher', None) is not None:
                         self.watcher.stop()
                 except Exception:
                     pass
+                if self.injector is not None:
+                    self.injector.stop()
+                try:
+                    self.dispatcher.close()
+                except Exception:
+                    pass
+                self.stop_event.set()
+                self._stop_tts_worker()
+                settings.flush()
+                if self.profiler is not None and self.profiler.running:
+                    self.profiler.stop()
             except Exception:
                 pass
+            applog.remove_sink(self._log_sink)
             self.root.destroy()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Speak RAGE:MP station tones.")
+    parser.add_argument('--debug', action='store_true',
+                        help="show [DEBUG] diagnostics (off by default; they cost time on every read)")
+    parser.add_argument('--log-file', metavar='PATH',
+                        help="also write the log to PATH, rotated when it reaches --log-max-kb")
+    parser.add_argument('--log-max-kb', type=int, default=1024, metavar='KB',
+                        help="size at which the log file is rotated (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve metrics on http://127.0.0.1:PORT/metrics (Prometheus) and /metrics.json")
+    parser.add_argument('--transcript', metavar='PATH',
+                        help="append every detected tone to PATH (tab-separated)")
+    parser.add_argument('--forward-port', type=int, metavar='PORT',
+                        help="send every detected tone as a JSON line to a consumer listening on 127.0.0.1:PORT")
+    parser.add_argument('--inject', nargs='?', const='', metavar='ADDRESS',
+                        help="accept newline-delimited raw lines on a local socket: a Unix socket path, or a port "
+                             f"on 127.0.0.1 (default: {inject.default_address()}); see inject.py")
+    parser.add_argument('--audio-out', metavar='device|FILE.wav',
+                        help="render speech to PCM and play it through one continuous stream, on the sound "
+                             "device (needs sounddevice) or into a WAV file")
+    parser.add_argument('--profile', nargs='?', type=float, const=PROFILE_SECONDS, metavar='SECONDS',
+                        help="profile the background threads for SECONDS (default: %(const)s) after start-up "
+                             "and write a report next to the settings file (also in the Tools menu)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="include allocation sites (tracemalloc) in profiles")
+    parser.add_argument('--null-tts', action='store_true',
+                        help="don't produce audio; messages are timed as if spoken (for load testing)")
+    return parser.parse_args(argv)
+
+
 # --- Run the Application ---
 if __name__ == "__main__":
+    args = parse_args()
+    applog.setup(level=logging.DEBUG if args.debug else logging.INFO,
+                 log_file=args.log_file, max_bytes=args.log_max_kb * 1024)
+    metrics_server = None
+    if args.metrics_port is not None:
+        try:
+            metrics_server = metrics.MetricsServer(args.metrics_port)
+            metrics_server.start()
+            log.info("Metrics available at http://127.0.0.1:%d/metrics", metrics_server.port)
+        except Exception as e:
+            log.error("Could not start metrics endpoint on port %s: %s", args.metrics_port, e)
+            metrics_server = None
     root = tk.Tk()
-    app = ToneReaderApp(root)
+    app = ToneReaderApp(root, transcript_path=args.transcript, forward_port=args.forward_port,
+                        inject_address=args.inject, null_tts=args.null_tts, audio_out=args.audio_out,
+                        profile_seconds=args.profile, profile_memory=args.profile_memory)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        applog.shutdown()
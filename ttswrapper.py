@@ -4,12 +4,41 @@ Provides a TTSWorker class that manages the pyttsx3 engine thread, queue,
 and COM initialization on Windows. Designed to be imported by the GUI
 module so the GUI doesn't need to manage threading/pyttsx3 details.
 """
+import itertools
+import math
+import os
+import re
+import tempfile
 import threading
-import queue
 import time
-import traceback
+import queue
+from collections import deque
 import pyttsx3
 
+import applog
+import audio
+import clock as clock_mod
+import metrics
+from events import ToneEvent
+import utils
+
+log = applog.get_logger('tts')
+
+_ENGINE_INITS = metrics.REGISTRY.counter(
+    'tonereader_tts_engine_inits_total', 'pyttsx3 engines created (one per message)')
+_DROPPED = metrics.REGISTRY.counter(
+    'tonereader_tts_dropped_total', 'Messages dropped because the TTS queue was full')
+_SEGMENT = metrics.REGISTRY.summary(
+    'tonereader_tts_segment_seconds', 'Handing a segment to the engine to it starting to play')
+_FIRST_AUDIO = metrics.REGISTRY.summary(
+    'tonereader_tts_first_audio_seconds', 'Scheduled speak time to first audible segment')
+_LATENCY = {
+    urgent: metrics.REGISTRY.summary(
+        'tonereader_tts_latency_seconds', 'Enqueue to first audio per message',
+        labels={'class': 'urgent' if urgent else 'routine'})
+    for urgent in (True, False)
+}
+
 try:
     import pythoncom
     _HAS_PYTHONCOM = True
@@ -18,48 +47,443 @@ except Exception:
     _HAS_PYTHONCOM = False
 
 
+# Sentence boundaries: terminal punctuation followed by whitespace and
+# something that looks like the start of a new sentence. Requiring the
+# capital/digit avoids splitting on things like "approx. two units".
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+# Clause boundaries, only used to break up sentences that are still too long.
+# Like the punctuation, spaced dashes and pipes stay with the clause before
+# them so the engine still pauses there.
+_CLAUSE_RE = re.compile(r"(?<=[,;:])\s+|(?<=\s-)\s+|(?<=\s--)\s+|(?<=\s[\u2013\u2014|])\s+")
+
+# Keep the last N segment timings for latency reporting.
+_LATENCY_HISTORY = 200
+
+
+def split_segments(text, max_chars=120):
+    """Split cleaned text into speakable segments.
+
+    The text is split at sentence boundaries first; any sentence longer
+    than `max_chars` is split again at clause boundaries (commas,
+    semicolons, dashes). Segments are never split mid-word, so a single
+    clause longer than `max_chars` is kept whole.
+    """
+    if not text:
+        return []
+    segments = []
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+            continue
+        # Greedily pack clauses back together up to max_chars so we don't
+        # end up with a choppy run of two-word segments.
+        current = ''
+        for clause in _CLAUSE_RE.split(sentence):
+            clause = clause.strip()
+            if not clause:
+                continue
+            if current and len(current) + 1 + len(clause) > max_chars:
+                segments.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            segments.append(current)
+    return segments
+
+
+class NullEngine:
+    """Silent stand-in for a pyttsx3 engine.
+
+    Implements the subset of the engine API TTSWorker uses. "Speaking"
+    takes len(words) / words_per_minute on the given clock, so with a
+    VirtualClock it costs no real time. Spoken text is passed to
+    `on_say(text, start_time)` if given. save_to_file() writes a quiet
+    sine tone of the same duration, so the PCM playback path (audio.py)
+    can be exercised headlessly.
+    """
+
+    def __init__(self, clock=None, words_per_minute=180, on_say=None):
+        self.clock = clock or clock_mod.SYSTEM
+        self.words_per_minute = words_per_minute
+        self.on_say = on_say
+        self._callbacks = {}
+        self._pending = []
+        self._stopped = threading.Event()
+        self.properties = {}
+
+    def connect(self, topic, cb):
+        self._callbacks.setdefault(topic, []).append(cb)
+        return (topic, cb)
+
+    def disconnect(self, token):
+        try:
+            self._callbacks[token[0]].remove(token[1])
+        except Exception:
+            pass
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def getProperty(self, name):
+        return self.properties.get(name)
+
+    def say(self, text, name=None):
+        self._pending.append((text, name))
+
+    def save_to_file(self, text, filename, name=None):
+        self._pending.append((text, (name, filename)))
+
+    def _duration(self, text):
+        return len(text.split()) * 60.0 / self.words_per_minute if self.words_per_minute else 0.0
+
+    def runAndWait(self):
+        self._stopped.clear()
+        pending, self._pending = self._pending, []
+        for text, name in pending:
+            if self._stopped.is_set():
+                break
+            if isinstance(name, tuple):
+                # save_to_file(): render instantly, no playback.
+                w = audio.WavSink(name[1])
+                w.open(audio.DEFAULT_RATE)
+                w.write(audio.tone(self._duration(text) or 0.1))
+                w.close()
+                continue
+            for cb in self._callbacks.get('started-utterance', []):
+                cb(name)
+            if self.on_say is not None:
+                self.on_say(text, self.clock.time())
+            duration = self._duration(text)
+            if duration:
+                self.clock.wait(self._stopped, duration)
+
+    def stop(self):
+        self._stopped.set()
+
+
 class TTSWorker:
-    def __init__(self, get_volume_callable=None, queue_maxsize=0):
+    def __init__(self, get_volume_callable=None, queue_maxsize=0,
+                 max_segment_chars=120, preempt_threshold=utils.PRIORITY_URGENT,
+                 requeue_interrupted=True, clock=None, engine_factory=None,
+                 audio_stream=None, engine_properties=None):
         """Create a TTSWorker.
 
         get_volume_callable: callable that returns current volume (0.0-1.0).
-        queue_maxsize: maxsize for internal queue (0 means infinite).
+        queue_maxsize: most messages that may wait to be spoken (0 means
+            no limit). enqueue() waits for room (block=True) or drops the
+            message; interrupted messages being requeued don't count.
+        max_segment_chars: soft limit for a single spoken segment; longer
+            messages are split at sentence/clause boundaries and spoken
+            one segment at a time.
+        preempt_threshold: messages enqueued with at least this priority
+            interrupt a lower-priority message that is currently playing.
+        requeue_interrupted: when a message is preempted, put its unspoken
+            segments back on the queue instead of dropping them.
+        clock: time source for delays and latency timestamps (clock.SYSTEM
+            by default; tests pass a clock.VirtualClock).
+        engine_factory: callable returning a new engine (pyttsx3.init by
+            default; NullEngine for headless runs).
+        audio_stream: an audio.PCMStream. If given, segments are rendered
+            to PCM with one long-lived engine and played through the
+            stream, so consecutive messages follow each other without
+            engine start-up gaps; otherwise each message gets its own
+            engine that plays directly.
+        engine_properties: extra engine properties (e.g. {'rate': 200,
+            'voice': id}) set on every new engine; None values are skipped.
+            May also be a callable returning such a dict, called for each
+            message so changed settings apply to the next one.
         """
         self.get_volume = get_volume_callable or (lambda: 1.0)
-        self._tts_queue = queue.Queue(maxsize=queue_maxsize)
+        self.max_segment_chars = max_segment_chars
+        self.preempt_threshold = preempt_threshold
+        self.requeue_interrupted = requeue_interrupted
+        self.clock = clock or clock_mod.SYSTEM
+        self.engine_factory = engine_factory or pyttsx3.init
+        self.audio = audio_stream
+        self.engine_properties = engine_properties if callable(engine_properties) else dict(engine_properties or {})
+        # Scratch file for rendering segments in stream mode.
+        self._render_path = os.path.join(tempfile.gettempdir(), f"tonereader-{os.getpid()}-{id(self)}.wav")
+        # Entries are (-priority, seq, event, speech, resumed) so the highest
+        # priority comes out first and equal priorities stay FIFO. `speech`
+        # is the text still to be spoken (all of it unless resumed).
+        # The queue itself is unbounded so requeues and the stop sentinel
+        # always fit; enqueue() enforces queue_maxsize, waiting on _room.
+        self._tts_queue = queue.PriorityQueue()
+        self.queue_maxsize = max(0, int(queue_maxsize or 0))
+        self._room = threading.Condition()
+        self._seq = itertools.count()
         self._stop = threading.Event()
-        self._thread = threading.Thread(target=self._loop, daemon=True)
+        # Set to cut the current message short at the next segment boundary.
+        self._interrupt = threading.Event()
+        # Set (with _interrupt) when the cut is due to a higher-priority item.
+        self._preempted = threading.Event()
+        # Priority of the message being waited on/spoken, None when idle.
+        self._current_priority = None
+        self._thread = threading.Thread(target=self._loop, name='tts', daemon=True)
         # Exposed engine pointer (set when an engine is active)
         self.engine = None
+        # Seconds from say() to the engine reporting the segment started,
+        # and from the scheduled speak time to the first audible segment.
+        self.segment_latencies = deque(maxlen=_LATENCY_HISTORY)
+        self.first_audio_latencies = deque(maxlen=_LATENCY_HISTORY)
+        # Seconds from enqueue timestamp to first audio, split by urgency.
+        self.urgent_latencies = deque(maxlen=_LATENCY_HISTORY)
+        self.routine_latencies = deque(maxlen=_LATENCY_HISTORY)
+        metrics.REGISTRY.gauge('tonereader_tts_queue_depth', 'Messages waiting to be spoken',
+                               fn=self._tts_queue.qsize)
 
     def start(self):
         if not self._thread.is_alive():
+            if self.audio is not None:
+                self.audio.start()
             self._thread.start()
 
     def stop(self, timeout=2.0):
         try:
             self._stop.set()
+            # Also wakes the worker if it's waiting out the speak delay.
+            self._interrupt.set()
+            # Release enqueue() calls waiting for room.
+            with self._room:
+                self._room.notify_all()
             # Wake the worker
             try:
-                self._tts_queue.put(None, block=False)
+                self._tts_queue.put((-math.inf, next(self._seq), None, None, False), block=False)
             except Exception:
                 pass
             try:
                 self._thread.join(timeout=timeout)
             except Exception:
                 pass
+            if self.audio is not None:
+                self.audio.stop(timeout)
+        except Exception:
+            pass
+
+    def interrupt(self):
+        """Cut the message currently being spoken short.
+
+        The worker stops the engine and skips any remaining segments of the
+        current message; queued messages are unaffected.
+        """
+        self._interrupt.set()
+        if self.audio is not None:
+            self.audio.interrupt()
+        eng = self.engine
+        if eng is not None:
+            try:
+                eng.stop()
+            except Exception:
+                pass
+
+    def latency_stats(self):
+        """Return percentile summaries (in ms) of recent segment timings."""
+        return {
+            'segment_ms': utils.percentiles([v * 1000.0 for v in self.segment_latencies]),
+            'first_audio_ms': utils.percentiles([v * 1000.0 for v in self.first_audio_latencies]),
+            'urgent_ms': utils.percentiles([v * 1000.0 for v in self.urgent_latencies]),
+            'routine_ms': utils.percentiles([v * 1000.0 for v in self.routine_latencies]),
+            'gap_ms': self.audio.gap_stats() if self.audio is not None else {},
+        }
+
+    def _configure(self, eng):
+        """Apply volume and engine_properties to an engine."""
+        eng.setProperty('volume', float(self.get_volume() or 1.0))
+        props = self.engine_properties
+        if callable(props):
+            try:
+                props = props() or {}
+            except Exception:
+                log.exception("Could not read engine properties")
+                props = {}
+        for name, value in props.items():
+            if value is not None:
+                try:
+                    eng.setProperty(name, value)
+                except Exception:
+                    log.warning("Engine rejected %s=%r", name, value)
+
+    def _requeue(self, item):
+        """Put an interrupted queue entry back, keeping its original order."""
+        try:
+            self._tts_queue.put(item, block=False)
+            log.debug("Requeued interrupted message (priority %s)", -item[0])
         except Exception:
             pass
 
-    def enqueue(self, text, ts=None, block=False, timeout=None):
-        if ts is None:
-            ts = time.time()
+    def enqueue(self, text, ts=None, block=False, timeout=None, priority=utils.PRIORITY_ROUTINE):
+        """Queue a message to be spoken 2 s after `ts`.
+
+        `text` is either a plain string or a ToneEvent; for an event the
+        spoken text, timestamp and priority come from the event
+        (speech/text, detected_at, priority) unless given explicitly.
+
+        When queue_maxsize messages are already waiting, block=True waits
+        for room (up to `timeout`, or until stop() if None) and block=False
+        drops the message. Returns False if the message was dropped.
+        """
+        if isinstance(text, ToneEvent):
+            event = text
+            if ts is not None:
+                event.detected_at = ts
+            if event.priority is None:
+                event.priority = priority
+            priority = event.priority
+        else:
+            event = ToneEvent(text, detected_at=self.clock.time() if ts is None else ts)
+            event.text = text
+            event.priority = priority
+        speech = event.speech or event.text or event.message
+        if self.queue_maxsize and not self._wait_for_room(block, timeout):
+            _DROPPED.inc()
+            return False
+        event.enqueued_at = self.clock.time()
+        self._tts_queue.put((-priority, next(self._seq), event, speech, False))
+        current = self._current_priority
+        if priority >= self.preempt_threshold and current is not None and priority > current:
+            log.debug("Priority %s message preempting priority %s", priority, current)
+            self._preempted.set()
+            self.interrupt()
+        return True
+
+    def _wait_for_room(self, block, timeout):
+        """Wait until fewer than queue_maxsize messages are queued."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._room:
+            while self._tts_queue.qsize() >= self.queue_maxsize:
+                if not block or self._stop.is_set():
+                    return False
+                wait = 0.25
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._room.wait(wait)
+        return True
+
+    def _speak_segments(self, eng, text, speak_time, on_first_audio=None):
+        """Speak `text` one segment at a time on an initialised engine.
+
+        Each segment is synthesized and played before the next one is
+        queued, so the first sentence is audible without waiting for the
+        engine to process the whole message. Stops early on stop() or
+        interrupt() and returns the segments that were not (fully) spoken.
+        """
+        segments = split_segments(text, self.max_segment_chars) or [text]
+        started = {}
+
+        def _on_start(name):
+            started.setdefault(name, self.clock.time())
+
+        token = None
         try:
-            self._tts_queue.put((text, ts), block=block, timeout=timeout)
+            token = eng.connect('started-utterance', _on_start)
         except Exception:
-            # Best-effort: drop if cannot enqueue
             pass
 
+        try:
+            for i, seg in enumerate(segments):
+                if self._stop.is_set() or self._interrupt.is_set():
+                    log.debug("Interrupted after %d/%d segments", i, len(segments))
+                    return segments[i:]
+                name = f"seg{i}"
+                t0 = self.clock.time()
+                eng.say(seg, name)
+                eng.runAndWait()
+                if self._interrupt.is_set():
+                    # engine.stop() cut this segment off part-way through.
+                    log.debug("Interrupted during segment %d/%d", i + 1, len(segments))
+                    return segments[i:]
+                t_start = started.get(name)
+                if t_start is None:
+                    # Driver didn't report the start; fall back to the
+                    # point where the segment finished playing.
+                    t_start = self.clock.time()
+                self.segment_latencies.append(t_start - t0)
+                _SEGMENT.observe(max(0.0, t_start - t0))
+                if i == 0:
+                    self.first_audio_latencies.append(max(0.0, t_start - speak_time))
+                    _FIRST_AUDIO.observe(max(0.0, t_start - speak_time))
+                    log.debug("First audio after %.0f ms (%d segment(s), %d chars)",
+                              (t_start - speak_time) * 1000.0, len(segments), len(text))
+                    if on_first_audio is not None:
+                        on_first_audio(t_start)
+            return []
+        finally:
+            if token is not None:
+                try:
+                    eng.disconnect(token)
+                except Exception:
+                    pass
+
+    def _stream_segments(self, eng, text, speak_time, on_first_audio=None):
+        """Stream-mode counterpart of _speak_segments.
+
+        Renders each segment to PCM and submits it to the audio stream.
+        The next segment is rendered while the previous one plays, but no
+        further ahead, so interrupt() still takes effect at the next
+        segment boundary. Returns once the last segment has played (see
+        _drain), or with the segments not (fully) played if interrupted.
+        """
+        segments = split_segments(text, self.max_segment_chars) or [text]
+        prev = None
+        for i, seg in enumerate(segments):
+            if self._stop.is_set() or self._interrupt.is_set():
+                log.debug("Interrupted after %d/%d segments", i, len(segments))
+                # The previous segment may have been cut off mid-way.
+                return segments[i - 1 if prev is not None else i:]
+            t0 = self.clock.time()
+            samples = audio.render(eng, seg, self._render_path)
+            if prev is not None:
+                # Don't queue more than one segment ahead of playback.
+                self.audio.wait_started(prev, self._interrupt)
+                if self._interrupt.is_set():
+                    return segments[i - 1:]
+            if not samples:
+                continue
+            utt = self.audio.submit(samples)
+            if prev is None:
+                self.audio.wait_started(utt, self._interrupt)
+                if self._interrupt.is_set():
+                    return segments[i:]
+                t_start = utt.started_at if utt.started_at is not None else self.clock.time()
+                self.segment_latencies.append(t_start - t0)
+                _SEGMENT.observe(max(0.0, t_start - t0))
+                self.first_audio_latencies.append(max(0.0, t_start - speak_time))
+                _FIRST_AUDIO.observe(max(0.0, t_start - speak_time))
+                log.debug("First audio after %.0f ms (%d segment(s), %d chars)",
+                          (t_start - speak_time) * 1000.0, len(segments), len(text))
+                if on_first_audio is not None:
+                    on_first_audio(t_start)
+            prev = utt
+        if prev is not None and not self._drain(prev):
+            return segments[-1:]
+        return []
+
+    def _drain(self, utt):
+        """Wait for `utt` to finish playing; False if interrupted first.
+
+        The message stays current (_current_priority) until then, so a
+        higher-priority enqueue() still preempts it. Stops waiting early
+        when the next queued message wouldn't preempt this one: rendering
+        it now keeps back-to-back messages gapless.
+        """
+        while not utt.done.is_set() and not self._stop.is_set():
+            if self._interrupt.is_set():
+                return False
+            with self._tts_queue.mutex:
+                head = self._tts_queue.queue[0] if self._tts_queue.queue else None
+            if head is not None:
+                p = -head[0]
+                if p < self.preempt_threshold or p <= (self._current_priority or 0):
+                    break
+            self.clock.wait(utt.done, 0.02)
+        return not self._interrupt.is_set()
+
     def _loop(self):
         """Internal worker loop. Mirrors the original behaviour from the
         monolithic script but scoped inside this class.
@@ -68,50 +492,100 @@ class TTSWorker:
             try:
                 pythoncom.CoInitialize()
             except Exception as e:
-                print(f"[WARN] pythoncom.CoInitialize() failed: {e}")
+                log.warning("pythoncom.CoInitialize() failed: %s", e)
 
+        # Long-lived engine used to render segments in stream mode.
+        render_engine = None
         try:
             while not self._stop.is_set():
                 try:
                     try:
-                        item = self._tts_queue.get(timeout=0.4)
+                        item = self.clock.get(self._tts_queue, 0.4)
                     except queue.Empty:
                         continue
+                    if self.queue_maxsize:
+                        with self._room:
+                            self._room.notify_all()
 
-                    if item is None:
+                    neg_prio, seq, event, text_item, resumed = item
+                    if event is None:
                         break
+                    priority = -neg_prio
+                    ts = event.detected_at
 
-                    if isinstance(item, str):
-                        text_item, ts = item, time.time()
-                    else:
-                        try:
-                            text_item, ts = item
-                        except Exception:
-                            text_item, ts = str(item), time.time()
+                    self._interrupt.clear()
+                    self._preempted.clear()
+                    self._current_priority = priority
 
                     speak_time = float(ts) + 2.0
-                    while (time.time() < speak_time) and (not self._stop.is_set()):
-                        time.sleep(0.05)
+                    while (self.clock.time() < speak_time) and (not self._stop.is_set()) \
+                            and (not self._interrupt.is_set()):
+                        self.clock.wait(self._interrupt, speak_time - self.clock.time())
 
                     if self._stop.is_set():
                         break
 
+                    if self._interrupt.is_set():
+                        # Preempted before we started speaking: nothing has
+                        # been said yet, so always put the whole item back.
+                        if self._preempted.is_set():
+                            self._requeue(item)
+                        self._current_priority = None
+                        continue
+
+                    urgent = priority >= self.preempt_threshold
+
+                    def _record(t_first):
+                        if resumed:
+                            return
+                        event.spoken_at = t_first
+                        target = self.urgent_latencies if urgent else self.routine_latencies
+                        target.append(max(0.0, t_first - float(ts)))
+                        _LATENCY[urgent].observe(target[-1])
+                        if urgent:
+                            pct = utils.percentiles([v * 1000.0 for v in target])
+                            log.info("Urgent message latency %.0f ms (p50 %.0f ms, p90 %.0f ms, n=%d)",
+                                     target[-1] * 1000.0, pct['p50'], pct['p90'], pct['count'])
+
+                    if self.audio is not None:
+                        try:
+                            if render_engine is None:
+                                render_engine = self.engine_factory()
+                                _ENGINE_INITS.inc()
+                            try:
+                                self._configure(render_engine)
+                            except Exception:
+                                pass
+                            remaining = self._stream_segments(render_engine, text_item, speak_time, _record)
+                            if remaining and self._preempted.is_set() and self.requeue_interrupted:
+                                self._requeue((neg_prio, seq, event, ' '.join(remaining), True))
+                        except Exception:
+                            log.exception("TTS render error")
+                            # Start over with a fresh engine next time.
+                            render_engine = None
+                            self.clock.sleep(0.05)
+                        finally:
+                            self._current_priority = None
+                        continue
+
                     eng = None
                     try:
-                        eng = pyttsx3.init()
+                        eng = self.engine_factory()
+                        _ENGINE_INITS.inc()
                         self.engine = eng
                         try:
-                            eng.setProperty('volume', float(self.get_volume() or 1.0))
+                            self._configure(eng)
                         except Exception:
                             pass
-                        eng.say(text_item)
-                        eng.runAndWait()
+                        remaining = self._speak_segments(eng, text_item, speak_time, _record)
+                        if remaining and self._preempted.is_set() and self.requeue_interrupted:
+                            self._requeue((neg_prio, seq, event, ' '.join(remaining), True))
                         try:
                             eng.stop()
                         except Exception:
                             pass
                     except Exception:
-                        traceback.print_exc()
+                        log.exception("TTS engine error")
                         try:
                             if eng:
                                 eng.stop()
@@ -119,11 +593,12 @@ class TTSWorker:
                             pass
                     finally:
                         self.engine = None
-                        time.sleep(0.05)
+                        self._current_priority = None
+                        self.clock.sleep(0.05)
 
                 except Exception:
-                    traceback.print_exc()
-                    time.sleep(0.2)
+                    log.exception("TTS worker error")
+                    self.clock.sleep(0.2)
         finally:
             if _HAS_PYTHONCOM:
                 try:
@@ -1,4 +1,6 @@
+import math
 import re
+import time
 
 # NOTE (developer guidance):
 #
@@ -45,20 +47,56 @@ KEYWORD = "** STATION TONE"
 MARKER_RE = re.compile(r"\*\*\s*\[?STATION\s+TONE\]?", re.IGNORECASE)
 
 
-def clean_text(raw: str) -> str:
+# Speech priorities. Higher numbers are spoken first; anything at or above
+# PRIORITY_URGENT interrupts a routine message that is already playing
+# (see ttswrapper.TTSWorker). A message gets the highest priority of the
+# marker that matched and any keyword it contains.
+PRIORITY_ROUTINE = 0
+PRIORITY_URGENT = 5
+
+# Priority per marker, keyed by the marker text with brackets/spacing
+# normalised (see `marker_id()`). Markers not listed here are routine.
+MARKER_PRIORITIES = {
+    'STATION TONE': PRIORITY_ROUTINE,
+}
+
+# Case-insensitive keywords/phrases that raise a message's priority.
+PRIORITY_KEYWORDS = {
+    'mayday': 9,
+    'firefighter down': 9,
+    'evacuate': 7,
+    'code 3': PRIORITY_URGENT,
+    'working fire': PRIORITY_URGENT,
+    'structure fire': PRIORITY_URGENT,
+    'entrapment': PRIORITY_URGENT,
+    'trapped': PRIORITY_URGENT,
+    'cardiac arrest': PRIORITY_URGENT,
+}
+
+_PRIORITY_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(k) for k in sorted(PRIORITY_KEYWORDS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def clean_text(raw: str, skip_marker: bool = False) -> str:
     """Return a cleaned message string suitable for speaking.
 
     - Removes the marker (if still present)
     - Removes timestamps like [HH:MM:SS]
     - Removes the literal KEYWORD
     - Strips surrounding whitespace
+
+    Pass skip_marker=True when `raw` is already the text after the marker
+    (e.g. events.ToneEvent.message) to avoid scanning for it again.
     """
     if not raw:
         return ''
 
-    m = MARKER_RE.search(raw)
-    if m:
-        raw = raw[m.end():]
+    if not skip_marker:
+        m = MARKER_RE.search(raw)
+        if m:
+            raw = raw[m.end():]
 
     # Remove timestamps
     s = re.sub(r"\[\d{2}:\d{2}:\d{2}\]", '', raw)
@@ -67,6 +105,77 @@ def clean_text(raw: str) -> str:
     return s.strip()
 
 
+_TIMESTAMP_RE = re.compile(r"\[(\d{2}):(\d{2}):(\d{2})\]")
+
+
+def parse_timestamp(line: str):
+    """Return the first [HH:MM:SS] in `line` as seconds since midnight, or None."""
+    if not line:
+        return None
+    m = _TIMESTAMP_RE.search(line)
+    if not m:
+        return None
+    h, mi, se = (int(g) for g in m.groups())
+    return h * 3600 + mi * 60 + se
+
+
+def timestamp_age(line: str, now=None):
+    """Return how many seconds ago the line's [HH:MM:SS] was, or None.
+
+    In-game timestamps have no date, so the age wraps at midnight (a line
+    stamped 23:59:50 read at 00:00:10 is 20 seconds old).
+    """
+    ts = parse_timestamp(line)
+    if ts is None:
+        return None
+    lt = time.localtime(now)
+    now_sod = lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec
+    return (now_sod - ts) % 86400
+
+
+def marker_id(marker_text: str) -> str:
+    """Normalise matched marker text, e.g. "** [station  tone]" -> "STATION TONE"."""
+    return ' '.join(re.sub(r"[*\[\]]", ' ', marker_text or '').split()).upper()
+
+
+# Named groups of the combined marker regex built from configured markers
+# (see settings.compile_markers), mapped to the configured marker id.
+MARKER_GROUP_IDS = {}
+
+
+def match_marker_id(match) -> str:
+    """Marker id for a marker regex match: the configured id if one of the
+    configured marker patterns matched, otherwise marker_id() of the text."""
+    if MARKER_GROUP_IDS:
+        groups = match.groupdict()
+        for name, mid in MARKER_GROUP_IDS.items():
+            if groups.get(name) is not None:
+                return mid
+    return marker_id(match.group(0))
+
+
+def message_priority(raw: str, marker: str = None) -> int:
+    """Return the speech priority for a raw or cleaned message.
+
+    Takes the priority of the marker (if `raw` still contains one) and of
+    any PRIORITY_KEYWORDS found in the text, whichever is highest. If the
+    marker id is already known, pass it as `marker` and `raw` is not
+    scanned for one.
+    """
+    prio = PRIORITY_ROUTINE
+    if marker is None and raw:
+        m = MARKER_RE.search(raw)
+        if m:
+            marker = marker_id(m.group(0))
+    if marker is not None:
+        prio = max(prio, MARKER_PRIORITIES.get(marker, PRIORITY_ROUTINE))
+    if not raw:
+        return prio
+    for kw in _PRIORITY_RE.findall(raw):
+        prio = max(prio, PRIORITY_KEYWORDS.get(kw.lower(), PRIORITY_ROUTINE))
+    return prio
+
+
 # Examples (for reference):
 #
 #   raw = "[12:34:56] ** STATION TONE Emergency at the docks"
@@ -78,3 +187,21 @@ def clean_text(raw: str) -> str:
 # and, if you want the UI test string to reflect the new default, update
 # KEYWORD too (or keep KEYWORD for backward compatibility and add a separate
 # DEFAULT_KEYWORD variable if you prefer).
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    """Return {'p50': ..., 'p90': ..., ...} for a sequence of numbers.
+
+    Uses nearest-rank on a sorted copy. Returns an empty dict when there
+    are no values so callers can report "no data" without special casing.
+    """
+    data = sorted(values)
+    if not data:
+        return {}
+    out = {}
+    n = len(data)
+    for p in ps:
+        idx = min(n - 1, max(0, math.ceil(p / 100.0 * n) - 1))
+        out[f"p{p}"] = data[idx]
+    out['count'] = n
+    return out
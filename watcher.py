@@ -2,29 +2,266 @@ import threading
 import time
 import os
 import json
+import hashlib
+
+import applog
+import clock as clock_mod
+import metrics
+import utils
+from events import ToneEvent
+
+log = applog.get_logger('watcher')
+
+_LINES_SCANNED = metrics.REGISTRY.counter(
+    'tonereader_lines_scanned_total', 'Log/chat_log lines checked for a tone marker')
+_MARKERS_MATCHED = metrics.REGISTRY.counter(
+    'tonereader_markers_matched_total', 'Lines that contained a tone marker')
+_STORAGE_PARSE = metrics.REGISTRY.summary(
+    'tonereader_storage_reparse_seconds', 'Time spent parsing .storage JSON for chat_log')
+
+# Default size of the chat_log tail kept for overlap alignment (KB).
+DEFAULT_TAIL_KB = 8
+
+# Characters of the start of chat_log kept to spot history trimmed from
+# the front, and the slice size used when hashing chat_log.
+_HEAD_CHARS = 256
+_HASH_CHUNK = 64 * 1024
+
+
+def scan_line(line, marker_re=utils.MARKER_RE, source=None, profile=None, now=None):
+    """Check one line for a tone marker.
+
+    Returns a ToneEvent if the line contains a marker (logged at READ
+    level), or None. The event's message may be empty if nothing follows
+    the marker. Shared by Watcher and the injection listener (inject.py)
+    so both count, log and extract lines the same way.
+    """
+    _LINES_SCANNED.inc()
+    m = marker_re.search(line)
+    if not m:
+        return None
+    _MARKERS_MATCHED.inc()
+    log.log(applog.READ, "%s", line.strip())
+    return ToneEvent.from_match(line, m, source, profile, now)
+
+
+def split_buffer(buffer):
+    """Split bytes read from a log into complete lines.
+
+    Returns (lines, rest): the decoded complete lines (without their
+    newlines) and the bytes of the trailing partial line, left undecoded
+    so a UTF-8 character split across two reads survives intact.
+    """
+    nl = buffer.rfind(b'\n')
+    if nl < 0:
+        return [], buffer
+    return buffer[:nl].decode('utf-8', errors='ignore').split('\n'), buffer[nl + 1:]
+
+
+def _encode(s):
+    # surrogatepass so any str the JSON parser produced can be hashed.
+    return s.encode('utf-8', errors='surrogatepass')
+
+
+def _hash_text(h, s, start=0, end=None):
+    """Feed s[start:end] to hasher `h` a slice at a time, so a large
+    chat_log is never copied or encoded in one piece. Returns `h`."""
+    end = len(s) if end is None else end
+    for i in range(start, end, _HASH_CHUNK):
+        h.update(_encode(s[i:min(i + _HASH_CHUNK, end)]))
+    return h
+
+
+def _new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+class ChatLogTracker:
+    """Bounded-memory record of the last `chat_log` seen in a .storage file.
+
+    Instead of keeping the whole previous chat_log string we keep its
+    length, a hash of its content and the last `tail_kb` KB of text. That
+    is enough to tell whether a new chat_log simply appends to the old one
+    (the common case) and, when the game trims old history from the
+    front, to find where the old content ends inside the new one. Memory
+    stays constant however large chat_log grows.
+
+    The append check compares the length, the first _HEAD_CHARS and the
+    remembered tail, and then hashes only the appended text into a running
+    hash. Its cost does not grow with the size of chat_log. The whole
+    prefix is hashed only after restore() (no running hash yet), to check
+    the file against the checkpoint.
+    """
+
+    def __init__(self, tail_kb=DEFAULT_TAIL_KB):
+        self.tail_chars = max(1, int(tail_kb * 1024))
+        self.length = None
+        self.digest = None
+        self.tail = ''
+        self.head = None
+        # Running hash of the remembered content; None after restore().
+        self._hasher = None
+
+    @property
+    def seeded(self):
+        return self.length is not None
+
+    def seed(self, chat):
+        """Record `chat` as the last seen content without emitting anything."""
+        self._hasher = _hash_text(_new_hasher(), chat)
+        self._remember(chat, self._hasher.digest())
+
+    def state(self):
+        """Return the tracker state as a JSON-friendly dict (empty if unseeded)."""
+        if not self.seeded:
+            return {}
+        return {'chat_len': self.length, 'chat_hash': self.digest.hex(), 'chat_tail': self.tail}
+
+    def restore(self, state):
+        """Load state produced by state(). Returns False if it's unusable."""
+        try:
+            length = int(state['chat_len'])
+            digest = bytes.fromhex(state['chat_hash'])
+            tail = str(state['chat_tail'])
+        except Exception:
+            return False
+        self.length = length
+        self.digest = digest
+        self.tail = tail[-self.tail_chars:]
+        self.head = None
+        self._hasher = None
+        return True
+
+    def _remember(self, chat, digest):
+        self.length = len(chat)
+        self.digest = digest
+        self.tail = chat[-self.tail_chars:]
+        self.head = chat[:_HEAD_CHARS]
+
+    def update(self, chat):
+        """Record `chat` and return the part that is new since last time.
+
+        Returns '' when nothing was added and None when the new content
+        couldn't be aligned with what we saw before (the caller should
+        skip speaking rather than risk duplicates).
+        """
+        if not self.seeded:
+            self.seed(chat)
+            return None
+
+        prev_len = self.length
+        new_part = None
+        if (len(chat) >= prev_len and chat.startswith(self.tail, prev_len - len(self.tail), prev_len)
+                and (self.head is None or chat.startswith(self.head))):
+            h = self._hasher
+            if h is None:
+                # Resuming from a checkpoint: confirm the whole prefix once.
+                h = _hash_text(_new_hasher(), chat, 0, prev_len)
+                if h.digest() != self.digest:
+                    h = None
+            if h is not None:
+                new_part = chat[prev_len:]
+                _hash_text(h, chat, prev_len)
+                self._hasher = h
+                self._remember(chat, h.digest())
+                return new_part
+
+        new_part = self._align(chat)
+        self.seed(chat)
+        return new_part
+
+    def _align(self, chat):
+        """Find where previously seen content ends inside `chat`.
+
+        Handles chat_log rewrites where old lines were dropped from the
+        front. Returns the text after the overlap, or None if there is no
+        overlap with the remembered tail.
+        """
+        tail = self.tail
+        if not tail or not chat:
+            return None
+        # Old content mostly still present: the whole tail appears in the
+        # new chat_log and everything after it is new.
+        pos = chat.find(tail)
+        if pos >= 0:
+            return chat[pos + len(tail):]
+        # History was trimmed past our tail window: the new chat_log starts
+        # with some suffix of the tail. Take the longest such suffix.
+        first = chat[0]
+        j = tail.find(first)
+        while j >= 0:
+            if chat.startswith(tail[j:]):
+                return chat[len(tail) - j:]
+            j = tail.find(first, j + 1)
+        return None
+
+
+class _Preview:
+    """Decodes a chunk for a debug message only if the message is emitted."""
+    __slots__ = ('chunk',)
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+
+    def __str__(self):
+        return self.chunk[:200].decode('utf-8', errors='ignore').replace('\n', ' ')
+
+
+def _read_chat_log(path):
+    """Return the `chat_log` string from a .storage JSON file, or None."""
+    t0 = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8') as jf:
+            data = json.load(jf)
+    except Exception:
+        return None
+    chat = data.get('chat_log') if isinstance(data, dict) else None
+    if not isinstance(chat, str):
+        return None
+    _STORAGE_PARSE.observe(time.perf_counter() - t0)
+    return chat
 
 
 class Watcher:
     """Follows a log file and calls back when marker lines are found.
 
-    on_message(text): called for each extracted message (not including marker/timestamp)
-    add_log_entry(text): thread-safe logging function (tonereader.add_log_entry is safe)
+    on_message(event): called with an events.ToneEvent for each marker line
+        that has a message after the marker
+    add_log_entry: unused, kept for backwards compatibility; diagnostics go
+        through the "tonereader.watcher" logger (see applog)
     marker_re: compiled regex to find markers in lines
+    tail_kb: size of the .storage chat_log tail kept for overlap alignment
+    checkpoint: read checkpoint from a previous run (see settings.load_checkpoint)
+    save_checkpoint(dict): called with the current checkpoint as reading progresses
+    replay_seconds: when resuming from a checkpoint, skip gap lines whose
+        [HH:MM:SS] timestamp is older than this (None replays the whole gap)
+    clock: time source for polling and timestamps (clock.SYSTEM by default;
+        tests pass a clock.VirtualClock)
     """
 
-    def __init__(self, path, on_message, add_log_entry, marker_re, stop_event=None):
+    def __init__(self, path, on_message, add_log_entry=None, marker_re=None, stop_event=None,
+                 tail_kb=DEFAULT_TAIL_KB, checkpoint=None, save_checkpoint=None,
+                 replay_seconds=None, clock=None):
         self.path = path
         self.on_message = on_message
-        self.add_log_entry = add_log_entry
-        self.marker_re = marker_re
+        self.marker_re = marker_re or utils.MARKER_RE
         self.stop_event = stop_event or threading.Event()
         self._thread = None
-        self._last_chat_log = None
+        self._chat = ChatLogTracker(tail_kb)
+        self.checkpoint = checkpoint
+        self.save_checkpoint = save_checkpoint
+        self.replay_seconds = replay_seconds
+        self.clock = clock or clock_mod.SYSTEM
+        self._last_checkpoint = None
+        # The game keeps one .storage per server profile in a folder named
+        # after it; remember that so events can say where they came from.
+        parent, base = os.path.split(os.path.abspath(path))
+        self.profile = os.path.basename(parent) if base == '.storage' else None
 
     def start(self):
         if self._thread and self._thread.is_alive():
             return
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread = threading.Thread(target=self._run, name='watcher', daemon=True)
         self._thread.start()
 
     def stop(self, timeout=2.0):
@@ -35,40 +272,125 @@ class Watcher:
         except Exception:
             pass
 
+    def _emit_line(self, line):
+        """Log and forward the message in `line` if it contains a marker."""
+        event = scan_line(line, self.marker_re, self.path, self.profile, self.clock.time())
+        if event is None:
+            return False
+        if event.end > event.start:
+            try:
+                self.on_message(event)
+            except Exception:
+                pass
+        return True
+
+    def _replay(self, lines):
+        """Emit lines written while we weren't running, honouring replay_seconds."""
+        replayed = skipped = 0
+        for line in lines:
+            if not line:
+                continue
+            if self.replay_seconds is not None:
+                age = utils.timestamp_age(line, self.clock.time())
+                if age is not None and age > self.replay_seconds:
+                    if self.marker_re.search(line):
+                        skipped += 1
+                    continue
+            if self._emit_line(line):
+                replayed += 1
+        if replayed or skipped:
+            if skipped:
+                log.info("Replayed %d tone(s) written while stopped; skipped %d older than %ss",
+                         replayed, skipped, self.replay_seconds)
+            else:
+                log.info("Replayed %d tone(s) written while stopped", replayed)
+
+    def _resume(self, file, log_path):
+        """Position `file` and the chat_log tracker for the start of a run.
+
+        Without a usable checkpoint this seeks to EOF and seeds from the
+        current chat_log, so history isn't spoken. With one, it picks up
+        where the previous run stopped and replays only the gap. Returns
+        any partial trailing line to seed the read buffer with.
+        """
+        cp = self.checkpoint if isinstance(self.checkpoint, dict) else None
+        try:
+            st = os.fstat(file.fileno())
+        except Exception:
+            st = None
+        file.seek(0, os.SEEK_END)
+
+        has_chat_cp = bool(cp and cp.get('chat_hash'))
+        if has_chat_cp and st and cp.get('size') == st.st_size and cp.get('mtime_ns') == st.st_mtime_ns \
+                and self._chat.restore(cp):
+            # Nothing changed since the checkpoint; skip the startup parse.
+            log.debug("Resumed from checkpoint (file unchanged)")
+            return b''
+
+        chat = _read_chat_log(log_path)
+        if chat is not None:
+            if has_chat_cp and self._chat.restore(cp):
+                new_part = self._chat.update(chat)
+                if new_part is None:
+                    log.debug("Checkpoint doesn't match chat_log; starting from current content")
+                elif new_part:
+                    self._replay(new_part.split('\n'))
+            else:
+                self._chat.seed(chat)
+                log.debug("Initialized chat_log length=%d", len(chat))
+            return b''
+
+        if cp and st and cp.get('dev') == st.st_dev and cp.get('ino') == st.st_ino:
+            offset = cp.get('offset')
+            if isinstance(offset, int) and 0 <= offset <= st.st_size:
+                file.seek(offset)
+                gap = file.read(st.st_size - offset)
+                log.debug("Resuming from checkpoint at byte %d (%d bytes to replay)", offset, len(gap))
+                lines = gap.split(b'\n')
+                self._replay(L.decode('utf-8', errors='ignore') for L in lines[:-1])
+                return lines[-1]
+        return b''
+
+    def _save_checkpoint(self, file, buffered=0):
+        """Report the current read position/fingerprint via save_checkpoint."""
+        if self.save_checkpoint is None:
+            return
+        try:
+            st = os.fstat(file.fileno())
+            cp = {
+                'dev': st.st_dev,
+                'ino': st.st_ino,
+                'offset': file.tell() - buffered,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+            }
+            cp.update(self._chat.state())
+            if cp == self._last_checkpoint:
+                return
+            self._last_checkpoint = cp
+            self.save_checkpoint(dict(cp, saved_at=self.clock.time()))
+        except Exception:
+            pass
+
     def _run(self):
         log_path = self.path
         try:
             file = open(log_path, 'rb')
             try:
-                try:
-                    file.seek(0, os.SEEK_END)
-                except Exception:
-                    pass
-
-                try:
-                    self.add_log_entry(f"[INFO] Watching file: {log_path}")
-                except Exception:
-                    pass
+                log.info("Watching file: %s", log_path)
 
-                # If this looks like a .storage JSON file, initialize our
-                # last-seen chat_log so we don't immediately speak history.
+                # Seek to EOF (or resume from a checkpoint) and initialize
+                # our last-seen .storage chat_log so we don't speak history.
                 try:
-                    with open(log_path, 'r', encoding='utf-8') as jf:
-                        try:
-                            data = json.load(jf)
-                            chat = data.get('chat_log') if isinstance(data, dict) else None
-                            if isinstance(chat, str):
-                                self._last_chat_log = chat
-                                try:
-                                    self.add_log_entry(f"[DEBUG] Initialized chat_log length={len(chat)}")
-                                except Exception:
-                                    pass
-                        except Exception:
-                            pass
+                    buffer = self._resume(file, log_path)
                 except Exception:
-                    pass
+                    buffer = b''
+                    try:
+                        file.seek(0, os.SEEK_END)
+                    except Exception:
+                        pass
+                self._save_checkpoint(file, len(buffer))
 
-                buffer = b''
                 try:
                     last_stat = os.stat(log_path)
                 except Exception:
@@ -89,10 +411,7 @@ class Watcher:
 
                         if cur_stat and last_stat and cur_pos is not None:
                             if cur_stat.st_size < cur_pos:
-                                try:
-                                    self.add_log_entry("[DEBUG] File truncated; seeking to end")
-                                except Exception:
-                                    pass
+                                log.debug("File truncated; seeking to end")
                                 try:
                                     file.seek(0, os.SEEK_END)
                                 except Exception:
@@ -107,65 +426,28 @@ class Watcher:
                                 try:
                                     file = open(log_path, 'rb')
                                     file.seek(0, os.SEEK_END)
-                                    try:
-                                        self.add_log_entry("[DEBUG] File replaced; reopened handle")
-                                    except Exception:
-                                        pass
+                                    log.debug("File replaced; reopened handle")
                                     # After reopening, try to parse .storage JSON and
                                     # only speak newly-added chat lines (if any).
                                     try:
-                                        with open(log_path, 'r', encoding='utf-8') as jf:
-                                            data = json.load(jf)
-                                            chat = data.get('chat_log') if isinstance(data, dict) else None
-                                            if isinstance(chat, str):
-                                                prev = self._last_chat_log or ''
-                                                new_part = ''
-                                                if prev and chat.startswith(prev):
-                                                    new_part = chat[len(prev):]
-                                                else:
-                                                    overlap = 0
-                                                    try:
-                                                        max_ol = min(len(prev), len(chat))
-                                                        for i in range(max_ol, 0, -1):
-                                                            if prev.endswith(chat[:i]):
-                                                                overlap = i
-                                                                break
-                                                    except Exception:
-                                                        overlap = 0
-
-                                                    if overlap > 0:
-                                                        new_part = chat[overlap:]
-                                                    else:
-                                                        try:
-                                                            self.add_log_entry("[DEBUG] .storage alignment failed; skipping speaking to avoid duplicates")
-                                                        except Exception:
-                                                            pass
-                                                        new_part = ''
-
-                                                if new_part:
-                                                    for L in new_part.split('\n'):
-                                                        if not L:
-                                                            continue
-                                                        m2 = self.marker_re.search(L)
-                                                        if m2:
-                                                            try:
-                                                                self.add_log_entry(f"[READ] {L.strip()}")
-                                                            except Exception:
-                                                                pass
-                                                            extracted2 = L[m2.end():].strip()
-                                                            if extracted2:
-                                                                try:
-                                                                    self.on_message(extracted2)
-                                                                except Exception:
-                                                                    pass
-
-                                                self._last_chat_log = chat
+                                        chat = _read_chat_log(log_path)
+                                        if chat is not None:
+                                            was_seeded = self._chat.seeded
+                                            new_part = self._chat.update(chat)
+                                            if new_part is None and was_seeded:
+                                                log.debug(".storage alignment failed; skipping speaking to avoid duplicates")
+
+                                            if new_part:
+                                                for L in new_part.split('\n'):
+                                                    if L:
+                                                        self._emit_line(L)
+                                            self._save_checkpoint(file)
                                     except Exception:
                                         pass
                                 except Exception:
-                                    time.sleep(0.5)
+                                    self.clock.sleep(0.5)
                                     last_stat = cur_stat
-                                    time.sleep(0.1)
+                                    self.clock.sleep(0.1)
                                     continue
 
                         last_stat = cur_stat
@@ -178,62 +460,29 @@ class Watcher:
                         chunk = b''
 
                     if not chunk:
-                        time.sleep(0.5)
+                        self.clock.wait(self.stop_event, 0.5)
                         continue
 
-                    try:
-                        preview = chunk.decode('utf-8', errors='ignore')[:200].replace('\n', ' ')
-                        self.add_log_entry(f"[DEBUG] Read {len(chunk)} bytes: {preview}")
-                    except Exception:
-                        pass
+                    log.debug("Read %d bytes: %s", len(chunk), _Preview(chunk))
 
                     buffer += chunk
-                    text = buffer.decode('utf-8', errors='ignore')
-
-                    if '\n' in text:
-                        parts = text.split('\n')
-                        for line in parts[:-1]:
-                            m = self.marker_re.search(line)
-                            if m:
-                                try:
-                                    self.add_log_entry(f"[READ] {line.strip()}")
-                                except Exception:
-                                    pass
-                                extracted = line[m.end():].strip()
-                                if extracted:
-                                    try:
-                                        self.on_message(extracted)
-                                    except Exception:
-                                        pass
+                    lines, rest = split_buffer(buffer)
 
-                        remainder = parts[-1]
-                        buffer = remainder.encode('utf-8', errors='ignore')
+                    if lines:
+                        for line in lines:
+                            self._emit_line(line)
+                        buffer = rest
                     else:
-                        m = self.marker_re.search(text)
-                        if m:
-                            try:
-                                self.add_log_entry(f"[READ] {text.strip()}")
-                            except Exception:
-                                pass
-                            extracted = text[m.end():].strip()
-                            if extracted:
-                                try:
-                                    self.on_message(extracted)
-                                except Exception:
-                                    pass
+                        if self._emit_line(buffer.decode('utf-8', errors='ignore')):
                             buffer = b''
+
+                    self._save_checkpoint(file, len(buffer))
             finally:
                 try:
                     file.close()
                 except Exception:
                     pass
         except FileNotFoundError:
-            try:
-                self.add_log_entry("[ERROR] Log file not found.")
-            except Exception:
-                pass
+            log.error("Log file not found: %s", log_path)
         except Exception as e:
-            try:
-                self.add_log_entry(f"[ERROR] Watcher error: {e}")
-            except Exception:
-                pass
+            log.exception("Watcher error: %s", e)